@@ -1,13 +1,29 @@
+import asyncio
 import datetime
+import email.utils
 import json
+import logging
+import mimetypes
 import re
 import os
+import sqlite3
+import random
+import threading
 import time
 import winreg
-from comtypes import COMError
+from comtypes import COMError, CoInitialize
+from concurrent.futures import ThreadPoolExecutor, wait
 from zashel.winhttp import Requests, encode, decode, LOCALPATH
+from .ranges import A1Range, column_letters
+from contextlib import contextmanager
 from functools import partial, wraps
-from math import floor
+from math import ceil
+from urllib.parse import quote, urlencode
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 #LOCALPATH = os.path.join(os.environ["LOCALAPPDATA"], "zashel", "gapi")
@@ -64,6 +80,14 @@ FILEDRIVE = FILESDRIVE + "/{}"
 FILEPERMISSIONS = FILEDRIVE + "/permissions"
 FILEDOWNLOAD = "https://drive.google.com/open"
 COPYFILE = FILESDRIVE + "/{}/copy"
+CHANGES = DRIVE + "/changes"
+UPLOADDRIVE = "https://www.googleapis.com/upload/drive/v3/files"
+UPLOADFILE = UPLOADDRIVE + "/{}"
+CHANGESSTART = CHANGES + "/startPageToken"
+DRIVEBATCH = "https://www.googleapis.com/batch/drive/v3"
+
+FILEFIELDS = "id,name,mimeType,modifiedTime,parents"
+FILESFIELDS = "nextPageToken,files({})".format(FILEFIELDS)
 
 SCRIPTS = "https://script.googleapis.com/v1/scripts/{}:run"
 
@@ -72,6 +96,10 @@ SHEET_VALUES = SHEETS + "/{}/values/{}"
 SHEET_APPEND = SHEET_VALUES + ":append"
 SHEET_CLEAR = SHEET_VALUES + ":clear"
 SHEET_BATCHUPDATE = SHEETS + "/{}:batchUpdate"
+SHEET_BATCHGET = SHEETS + "/{}/values:batchGet"
+SHEET_BATCHUPDATEVALUES = SHEETS + "/{}/values:batchUpdate"
+SHEET_BATCHCLEAR = SHEETS + "/{}/values:batchClear"
+SHEET_BATCHGETBYDATAFILTER = SHEETS + "/{}/values:batchGetByDataFilter"
 
 
 if not os.path.exists(LOCALPATH):
@@ -79,6 +107,28 @@ if not os.path.exists(LOCALPATH):
 
 
 QUERYTIMEOUT = 5
+CHUNKSIZE = 8 * 1024 * 1024  # Bytes of each range of streamed downloads
+UPLOADCHUNKSIZE = 32 * 256 * 1024  # Bytes of each chunk of resumable uploads, must be a multiple of 256 KiB
+GOOGLETYPES = {"document": "application/vnd.google-apps.document",
+               "drawing": "application/vnd.google-apps.drawing",
+               "presentation": "application/vnd.google-apps.presentation",
+               "spreadsheet": "application/vnd.google-apps.spreadsheet"}
+MISSTIMEOUT = 30  # Seconds a name not found in Files is answered as missing without asking Drive again
+RETRYSTATUSES = (500, 502, 503, 504, 429, 408)
+SNAPSHOTCHECK = 5  # Seconds between checks of the modifiedTime of a cached sheet
+PAGESIZE = 1000  # Rows got in each request when iterating a sheet
+APPENDCHUNK = 1000  # Rows appended in each request by bulk appends
+LOADINGVALUES = ("Loading...", "Cargando...")  # Shown by cells whose formula is still being calculated
+POLLATTEMPTS = 6  # Reads of cells still being calculated after a write, with backoff between them
+SERIALEPOCH = datetime.datetime(1899, 12, 30)  # Day 0 of dates rendered as serial numbers
+LATENCYBUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Upper bounds in seconds of the latency histogram
+BATCHSIZE = 100  # Maximum number of requests in a batch of Drive
+ROWTAG = "gapi.{}"  # Key of the developer metadata tagging rows with the value of the column named in it
+METADATALIMIT = 30000  # Characters of keys and values of the developer metadata the Sheets API allows for a sheet
+QUOTAS = {"drive": (1000, 100),  # Requests allowed for each API family by user in the given seconds
+          "sheets_read": (60, 60),
+          "sheets_write": (60, 60),
+          "script": (30, 60)}
 
 
 reghandle = winreg.CreateKey(winreg.HKEY_CURRENT_USER, "Software\\Microsoft\\Windows\\CurrentVersion\\" +\
@@ -92,6 +142,9 @@ del(reghandle)
 class DriveNotFoundError(Exception):
     pass
 
+class DriveError(Exception):
+    pass
+
 class TeamDriveNotFoundError(Exception):
     pass
 
@@ -107,14 +160,471 @@ class SheetError(Exception):
 class SpreadsheetNotFoundError(FileNotFoundError):
     pass
 
+class RetryError(Exception):
+    def __init__(self, message, *, attempts=0, status_code=None, error=None):
+        Exception.__init__(self, message)
+        self.attempts = attempts
+        self.status_code = status_code
+        self.error = error
+
+class DeadlineExceededError(RetryError):
+    pass
+
+class HeadersNotAvailableError(Exception):
+    pass
+
+
+class RetryPolicy(object):
+    """
+    Policy of retries of failed requests: exponential backoff with jitter, honouring Retry-After, with a maximum
+    number of attempts and an optional deadline for the whole call.
+    """
+    def __init__(self, *, attempts=8, base=0.5, factor=2, max_delay=32, jitter=0.5, deadline=None,
+                 statuses=RETRYSTATUSES):
+        """
+        Initializes the policy.
+        :param attempts: maximum number of attempts of a call, first one included. None for no limit
+        :param base: seconds to wait before the first retry
+        :param factor: multiplier of the wait for each new retry
+        :param max_delay: maximum seconds to wait between attempts
+        :param jitter: fraction of each wait randomly discounted, to spread retries of concurrent callers
+        :param deadline: maximum seconds a call may last with its retries. None for no limit
+        :param statuses: HTTP status codes to be retried
+        """
+        self.attempts = attempts
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.statuses = statuses
+
+    def begin(self):
+        """
+        Starts counting the attempts of a new call.
+        :return: gapi.RetryCounter instance
+        """
+        return RetryCounter(self)
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Gives the seconds to wait before the given retry.
+        :param attempt: number of the retry, begining with 1
+        :param retry_after: seconds asked by the server in a Retry-After header, if any
+        :return: seconds to wait
+        """
+        delay = min(self.max_delay, self.base * self.factor ** (attempt - 1))
+        delay = delay * (1 - self.jitter * random.random())
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryCounter(object):
+    """
+    Attempts of a single call under a gapi.RetryPolicy.
+    """
+    def __init__(self, policy):
+        self.policy = policy
+        self.retries = 0
+        self.started = time.monotonic()
+
+    def backoff(self, *, status_code=None, error=None, retry_after=None):
+        """
+        Waits before the next attempt of the call.
+        :param status_code: HTTP status code of the failed attempt
+        :param error: exception raised by the failed attempt
+        :param retry_after: seconds asked by the server in a Retry-After header, if any
+        :return: None
+        :raises RetryError: if the maximum number of attempts is reached
+        :raises DeadlineExceededError: if waiting would exceed the deadline of the call
+        """
+        self.retries += 1
+        attempts = self.retries + 1
+        if self.policy.attempts is not None and attempts > self.policy.attempts:
+            raise RetryError(f"Gave up after {self.retries} attempts", attempts=self.retries,
+                             status_code=status_code, error=error)
+        delay = self.policy.delay(self.retries, retry_after)
+        if self.policy.deadline is not None and \
+                time.monotonic() + delay - self.started > self.policy.deadline:
+            raise DeadlineExceededError(f"Deadline of {self.policy.deadline}s exceeded after {self.retries} attempts",
+                                        attempts=self.retries, status_code=status_code, error=error)
+        time.sleep(delay)
+
+
+class MetadataCache(object):
+    """
+    Persistent cache of drive listings, teamdrives and spreadsheet resources, kept in a SQLite file under LOCALPATH
+    so new processes start from the last known metadata. It may be shared by several processes at once. Entries are
+    stored with a version (changes page token, modifiedTime) to be validated before they are used. Listings are
+    stored with a row for each file, so changes only write the files changed.
+    """
+    def __init__(self, path=None, *, timeout=30):
+        """
+        Initializes the cache, creating the file if it does not exist.
+        :param path: path of the SQLite file. "cache.sqlite3" in LOCALPATH by default
+        :param timeout: seconds to wait for other processes writing the cache
+        """
+        if path is None:
+            path = os.path.join(LOCALPATH, "cache.sqlite3")
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (kind TEXT NOT NULL, key TEXT NOT NULL, "
+                               "version TEXT, data TEXT NOT NULL, stored REAL NOT NULL, PRIMARY KEY (kind, key))")
+            connection.execute("CREATE TABLE IF NOT EXISTS files (listing TEXT NOT NULL, id TEXT NOT NULL, "
+                               "data TEXT NOT NULL, PRIMARY KEY (listing, id))")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def delete(self, kind, key):
+        """
+        Removes an entry.
+        :param kind: kind of the entry: "listing", "teamdrives", "resource"...
+        :param key: key of the entry
+        :return: None
+        """
+        with self._connection() as connection:
+            connection.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+
+    def get(self, kind, key):
+        """
+        Gives an entry.
+        :param kind: kind of the entry: "listing", "teamdrives", "resource"...
+        :param key: key of the entry
+        :return: tuple of (version, data), or (None, None) if the entry is not cached
+        """
+        row = self._connection().execute("SELECT version, data FROM entries WHERE kind = ? AND key = ?",
+                                         (kind, key)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def get_files(self, key):
+        """
+        Gives the files of a listing.
+        :param key: key of the listing
+        :return: tuple of (version, list of file resources), or (None, None) if the listing is not cached
+        """
+        version, data = self.get("files", key)
+        if version is None:
+            return None, None
+        rows = self._connection().execute("SELECT data FROM files WHERE listing = ?", (key,)).fetchall()
+        return version, [json.loads(row[0]) for row in rows]
+
+    def set_files(self, key, files, version, *, removed=None, replace=False):
+        """
+        Stores files of a listing and its new version in a single transaction.
+        :param key: key of the listing
+        :param files: list of file resources to add or replace
+        :param version: version of the listing
+        :param removed: ids of the files to remove from the listing
+        :param replace: whether files are the whole listing, removing every other file
+        :return: None
+        """
+        with self._connection() as connection:
+            if replace is True:
+                connection.execute("DELETE FROM files WHERE listing = ?", (key,))
+            connection.executemany("DELETE FROM files WHERE listing = ? AND id = ?",
+                                   [(key, file_id) for file_id in removed or list()])
+            connection.executemany("INSERT OR REPLACE INTO files (listing, id, data) VALUES (?, ?, ?)",
+                                   [(key, item["id"], json.dumps(item)) for item in files])
+            connection.execute("INSERT OR REPLACE INTO entries (kind, key, version, data, stored) VALUES (?, ?, ?, ?, ?)",
+                               ("files", key, version, json.dumps(None), time.time()))
+
+    def set(self, kind, key, data, version=None):
+        """
+        Stores an entry, replacing the previous one.
+        :param kind: kind of the entry: "listing", "teamdrives", "resource"...
+        :param key: key of the entry
+        :param data: JSON serializable data of the entry
+        :param version: version of the data, to validate it when it is got
+        :return: None
+        """
+        with self._connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO entries (kind, key, version, data, stored) VALUES (?, ?, ?, ?, ?)",
+                               (kind, key, version, json.dumps(data), time.time()))
+
+
+def batch_encode(requests, boundary):
+    """
+    Builds the multipart/mixed body of a batch of requests.
+    :param requests: list of dicts with "method", "url" and, optionally, "get" and "json" of each request
+    :param boundary: boundary of the parts
+    :return: body of the batch. Each part has the index of its request as Content-ID
+    """
+    parts = list()
+    for index, request in enumerate(requests):
+        url = re.sub(r"^https://[^/]+", "", request["url"])
+        get = dict([(key, str(value).lower() if isinstance(value, bool) else value)
+                    for key, value in request.get("get", dict()).items() if value is not None])
+        if len(get) > 0:
+            url += "?" + urlencode(get, quote_via=quote)
+        part = ["--" + boundary,
+                "Content-Type: application/http",
+                "Content-ID: <item{}>".format(index),
+                "",
+                "{} {} HTTP/1.1".format(request["method"], url)]
+        if request.get("json") is not None:
+            part.extend(["Content-Type: application/json; charset=UTF-8", "", json.dumps(request["json"])])
+        else:
+            part.append("")
+        parts.append("\r\n".join(part))
+    return "\r\n".join(parts + ["--" + boundary + "--", ""])
+
+
+def batch_decode(text, boundary=None):
+    """
+    Parses the multipart/mixed response of a batch of requests.
+    :param text: body of the response
+    :param boundary: boundary of the parts. Taken from the body if not given
+    :return: dict of {index of the request: (status code, decoded body)}
+    """
+    text = text.replace("\r\n", "\n")
+    if boundary is None:
+        boundary = text.strip().split("\n", 1)[0][2:]
+    final = dict()
+    for part in text.split("--" + boundary):
+        if "\n\n" not in part.strip():
+            continue
+        headers, response = part.strip().split("\n\n", 1)
+        content_id = re.search(r"Content-ID:\s*<?response-item([0-9]+)>?", headers, re.IGNORECASE)
+        status = re.match(r"HTTP/[0-9.]+\s+([0-9]+)", response)
+        if content_id is None or status is None:
+            continue
+        body = response.split("\n\n", 1)[1].strip() if "\n\n" in response else str()
+        try:
+            data = body and json.loads(body) or dict()
+        except json.decoder.JSONDecodeError:
+            data = {"error": {"code": int(status.group(1)), "message": body}}
+        final[int(content_id.group(1))] = (int(status.group(1)), data)
+    return final
+
+
+def api_family(method, url):
+    """
+    Gives the API family whose quota a request is charged to.
+    :param method: HTTP method of the request
+    :param url: requested url
+    :return: "drive", "sheets_read", "sheets_write", "script", or None for other APIs
+    """
+    if url.startswith(SHEETS):
+        if method == "GET" or "DataFilter" in url:
+            return "sheets_read"
+        return "sheets_write"
+    elif url.startswith(DRIVE) or url.startswith(UPLOADDRIVE) or url.startswith(DRIVEBATCH) or \
+            url.startswith(FILEDOWNLOAD):
+        return "drive"
+    elif url.startswith(SCRIPTS.split("{}")[0]):
+        return "script"
+    return None
+
+
+def rate_limit_exceeded(status_code, data):
+    """
+    Tells whether a response is the 403 Drive gives to requests over the rate limit, retried as a 429.
+    :param status_code: status code of the response
+    :param data: decoded body of the response, or its text
+    :return: True if the response is a rate limit error
+    """
+    if status_code != 403:
+        return False
+    if isinstance(data, (str, bytes)):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return False
+    if not isinstance(data, dict) or not isinstance(data.get("error"), dict):
+        return False
+    errors = data["error"].get("errors", list())
+    return any([error.get("reason") in ("rateLimitExceeded", "userRateLimitExceeded") for error in errors])
+
+
+class RateLimiter(object):
+    """
+    Token buckets pacing the requests of each API family just under its quota, so concurrent callers wait for their
+    turn instead of being answered with 429. A limiter may be shared by several gapi.GoogleAPI, and by several
+    processes through a SQLite file.
+    """
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, quotas=QUOTAS, *, margin=0.9, burst=10, path=None, timeout=30):
+        """
+        Initializes the limiter with full buckets.
+        :param quotas: dict of {API family: (requests, seconds)} allowed. QUOTAS by default
+        :param margin: fraction of the quotas used
+        :param burst: maximum number of requests of a family made at once after being idle
+        :param path: path of a SQLite file keeping the buckets, to share them between processes. True to use
+                     "ratelimit.sqlite3" in LOCALPATH. None to keep them in memory
+        :param timeout: seconds to wait for other processes using the file
+        """
+        self.rates = dict([(family, requests * margin / seconds) for family, (requests, seconds) in quotas.items()])
+        self.capacities = dict([(family, max(1, min(burst, requests * margin))) for family, (requests, seconds)
+                                in quotas.items()])
+        if path is True:
+            path = os.path.join(LOCALPATH, "ratelimit.sqlite3")
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._buckets = dict()
+        self._local = threading.local()
+        if path is not None:
+            with self._connection() as connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS buckets (family TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                                   "updated REAL NOT NULL)")
+
+    @classmethod
+    def default(cls):
+        """
+        Gives the limiter shared by the whole process.
+        :return: gapi.RateLimiter instance
+        """
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _take(self, family, tokens, drain=None):
+        """
+        Takes tokens of a bucket, letting it go negative so later callers queue behind this one.
+        :param drain: seconds of requests to remove from the bucket, instead of taking tokens
+        :return: seconds to wait before making the request
+        """
+        rate = self.rates[family]
+        capacity = self.capacities[family]
+        if self.path is None:
+            with self._lock:
+                now = time.monotonic()
+                available, updated = self._buckets.get(family, (capacity, now))
+                available = min(capacity, available + (now - updated) * rate)
+                if drain is None:
+                    available -= tokens
+                else:
+                    available = min(available, -drain * rate)
+                self._buckets[family] = (available, now)
+        else:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = connection.execute("SELECT tokens, updated FROM buckets WHERE family = ?",
+                                         (family,)).fetchone()
+                available, updated = row or (capacity, now)
+                available = min(capacity, available + max(0, now - updated) * rate)
+                if drain is None:
+                    available -= tokens
+                else:
+                    available = min(available, -drain * rate)
+                connection.execute("INSERT OR REPLACE INTO buckets (family, tokens, updated) VALUES (?, ?, ?)",
+                                   (family, available, now))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return max(0, -available / rate)
+
+    def acquire(self, family, tokens=1):
+        """
+        Waits until the given family may make a request.
+        :param family: API family, as given by gapi.api_family. Families without quota are not paced
+        :param tokens: number of requests to make
+        :return: seconds waited
+        """
+        if family not in self.rates:
+            return 0
+        wait = self._take(family, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttle(self, family, seconds):
+        """
+        Empties the bucket of a family for the given seconds, after the server answered it is over quota.
+        :param family: API family, as given by gapi.api_family
+        :param seconds: seconds no request of the family should be made
+        :return: None
+        """
+        if family in self.rates:
+            self._take(family, 0, drain=seconds)
+
+
+def files_query(*, mime_type=None, parent=None, name=None, modified_after=None, trashed=None):
+    """
+    Builds the "q" parameter of a Drive files listing.
+    :param mime_type: mimeType of the files
+    :param parent: id of the folder the files are in
+    :param name: exact name of the files
+    :param modified_after: files modified after the given datetime.datetime or RFC 3339 string
+    :param trashed: whether the files are in the trash or not
+    :return: query string, empty if no filter is given
+    """
+    def quoted(value):
+        return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+    query = list()
+    if mime_type is not None:
+        query.append("mimeType = " + quoted(mime_type))
+    if parent is not None:
+        query.append(quoted(parent) + " in parents")
+    if name is not None:
+        query.append("name = " + quoted(name))
+    if modified_after is not None:
+        if isinstance(modified_after, datetime.datetime):
+            modified_after = modified_after.isoformat()
+        query.append("modifiedTime > " + quoted(modified_after))
+    if trashed is not None:
+        query.append("trashed = " + (trashed and "true" or "false"))
+    return " and ".join(query)
+
 
 class Files(dict):
-    def __init__(self, gapi, drive_name, is_teamdrive=False, *, _type=None):
+    """
+    Files of a drive by name. Files are listed again when they are older than 5 minutes, and names not found are
+    searched for in Drive by name and remembered as missing for MISSTIMEOUT seconds. In incremental mode only the
+    changes since the last load are got from the changes API, so refreshing costs as much as the number of changes,
+    and removed, trashed and renamed files leave the index.
+    """
+    def __init__(self, gapi, drive_name, is_teamdrive=False, *, _type=None, incremental=False, query=None,
+                 fields=FILESFIELDS):
+        """
+        Initializes and lists the files.
+        :param gapi: gapi.GoogleAPI instance
+        :param drive_name: name of the drive. Opened drive by default
+        :param is_teamdrive: whether the drive is a teamdrive or not
+        :param _type: mimeType of the files to list
+        :param incremental: whether files are refreshed with the changes API
+        :param query: dict of filters of files sent to Drive, as taken by gapi.files_query
+        :param fields: fields of the listing to get. Only id, name, mimeType, modifiedTime and parents by default.
+                       None to get default fields
+        """
         self.gapi = gapi
         self.drive_name = drive_name
         self.is_teamdrive = is_teamdrive
+        self.drive_id = None
+        self.incremental = incremental
+        self.page_token = None
         self.last_loaded = datetime.datetime.now() - datetime.timedelta(minutes=10)
         self._type = _type
+        self.query = query or dict()
+        self.fields = fields
+        self._names = dict()
+        self._misses = dict()
+        self._lock = threading.RLock()
         self.load(True)
         dict.__init__(self)
 
@@ -131,55 +641,671 @@ class Files(dict):
     def __contains__(self, filename):
         if dict.__contains__(self, filename):
             return True
-        else:
-            self.load(True)
-            return dict.__contains__(self, filename)
+        expires = self._misses.get(filename)
+        if expires is not None and expires > time.monotonic():
+            return False
+        return self.lookup(filename)
+
+    def add(self, item):
+        """
+        Adds a file to the index, as given by Drive.
+        :param item: dict with at least id, name and mimeType of the file
+        :return: None
+        """
+        with self._lock:
+            if self._matches(item) is True:
+                dict.__setitem__(self, item["name"], item)
+                self._names[item["id"]] = item["name"]
+                self._misses.pop(item["name"], None)
+
+    def lookup(self, filename):
+        """
+        Searches Drive for files with the given name and adds them to the index. Names not found are remembered as
+        missing for MISSTIMEOUT seconds.
+        :param filename: exact name of the file
+        :return: whether the file was found or not
+        :raises DriveError: if Drive answers with an error
+        """
+        with self._lock:
+            get = self._list_params(name=filename)
+            data = self.gapi._request_json("GET", FILESDRIVE, get=get)
+            if "error" in data:
+                raise DriveError(data["error"])
+            found = False
+            for item in data.get("files", list()):
+                if item["name"] == filename and self._matches(item) is True:
+                    self.add(item)
+                    found = True
+            if found is False:
+                self._misses[filename] = time.monotonic() + MISSTIMEOUT
+            return found
 
     def copy(self):
-        return Files(self.gapi, self.drive_name, self.is_teamdrive, _type=self._type)
+        return Files(self.gapi, self.drive_name, self.is_teamdrive, _type=self._type, incremental=self.incremental,
+                     query=self.query, fields=self.fields)
+
+    def _drive_query(self):
+        get = dict()
+        if self.is_teamdrive is True:
+            get.update({"supportsTeamDrives": "true",
+                        "includeTeamDriveItems": "true",
+                        "teamDriveId": self.drive_id})
+        return get
+
+    def _apply_change(self, change):
+        """
+        Applies a change of the drive to the index.
+        :return: set of ids of the files whose entry changed
+        """
+        if change.get("type", "file") != "file":
+            return set()
+        file_id = change["fileId"]
+        touched = {file_id}
+        name = self._names.pop(file_id, None)
+        if name is not None and dict.__contains__(self, name) and dict.__getitem__(self, name)["id"] == file_id:
+            dict.__delitem__(self, name)
+        item = change.get("file")
+        if change.get("removed") is True or item is None or item.get("trashed") is True:
+            return touched
+        if self._matches(item) is True:
+            if dict.__contains__(self, item["name"]):  # A file with the same name is replaced in the index
+                displaced = dict.__getitem__(self, item["name"])["id"]
+                self._names.pop(displaced, None)
+                touched.add(displaced)
+            dict.__setitem__(self, item["name"], item)
+            self._names[file_id] = item["name"]
+        return touched
 
-    def load(self, force=False):
-        if force is True or (force is False and
-                                     self.last_loaded <= datetime.datetime.now() - datetime.timedelta(minutes=5)):
-            print("Loading Files")
-            if self.drive_name is not None:
-                if self.is_teamdrive is True:  # TODO
-                    self.gapi._teamdrives_list()
-                    drives = self.gapi._teamdrives
-                else:
-                    pass
-                    drives = self.gapi._drives
-                if self.drive_name not in drives:
-                    raise self.is_teamdrive and TeamDriveNotFoundError() or DriveNotFoundError()
-                self.gapi._drive_id = drives[self.drive_name]
-                self.gapi._is_teamdrive = self.is_teamdrive
-            get = dict()
-            if self.gapi._is_teamdrive is True:
-                get.update({"corpora": "teamDrive",
-                            "includeTeamDriveItems": "true",
-                            "supportsTeamDrives": "true",
-                            "teamDriveId": self.gapi._drive_id})
-            get.update({"pageSize": 1000})
+    @property
+    def cache_key(self):
+        """
+        Gives the key of the listing in the gapi.MetadataCache.
+        """
+        return json.dumps([self.drive_name, self.drive_id, self.is_teamdrive, self._type, self.query, self.fields],
+                          sort_keys=True, default=str)
+
+    def _persist(self, file_ids=None):
+        """
+        Stores the index in the gapi.MetadataCache.
+        :param file_ids: ids of the files changed since it was stored. The whole index by default
+        """
+        cache = self.gapi.cache
+        if cache is None or self.incremental is not True or self.page_token is None:
+            return
+        if file_ids is None:
+            cache.set_files(self.cache_key, list(dict.values(self)), self.page_token, replace=True)
+            return
+        files = [dict.__getitem__(self, self._names[file_id]) for file_id in file_ids if file_id in self._names]
+        removed = [file_id for file_id in file_ids if file_id not in self._names]
+        cache.set_files(self.cache_key, files, self.page_token, removed=removed)
+
+    def _restore(self):
+        cache = self.gapi.cache
+        if cache is None:
+            return False
+        if self.drive_name is not None and self.is_teamdrive is True:
+            self.gapi._teamdrives_list(self.drive_name)
+            self.drive_id = self.gapi._teamdrives.get(self.drive_name)
+        elif self.drive_name is not None:
+            self.drive_id = self.gapi._drives.get(self.drive_name)
+        elif self.drive_id is None:
+            self.drive_id = self.gapi._drive_id
+            self.is_teamdrive = self.gapi._is_teamdrive
+        page_token, files = cache.get_files(self.cache_key)
+        if page_token is None:
+            return False
+        dict.clear(self)
+        dict.update(self, [(item["name"], item) for item in files])
+        self._names = dict([(item["id"], name) for name, item in dict.items(self)])
+        self.page_token = page_token
+        return True
+
+    def _list_params(self, **filters):
+        get = dict()
+        if self.is_teamdrive is True:
+            get.update({"corpora": "teamDrive",
+                        "includeTeamDriveItems": "true",
+                        "supportsTeamDrives": "true",
+                        "teamDriveId": self.drive_id})
+        query = dict(self.query)
+        query.update(filters)
+        if self._type is not None:
+            query["mime_type"] = self._type
+        if self.incremental is True:
+            query["trashed"] = False
+        query = files_query(**query)
+        if query:
+            get.update({"q": query})
+        if self.fields is not None:
+            get.update({"fields": self.fields})
+        get.update({"pageSize": 1000})
+        return get
+
+    def _matches(self, item):
+        if self._type is not None and item["mimeType"] != self._type:
+            return False
+        query = self.query
+        if "mime_type" in query and query["mime_type"] is not None and item["mimeType"] != query["mime_type"]:
+            return False
+        if "parent" in query and query["parent"] is not None and query["parent"] not in item.get("parents", list()):
+            return False
+        if "name" in query and query["name"] is not None and item["name"] != query["name"]:
+            return False
+        if "modified_after" in query and query["modified_after"] is not None:
+            modified_after = query["modified_after"]
+            if isinstance(modified_after, datetime.datetime):
+                modified_after = modified_after.isoformat()
+            if item.get("modifiedTime", "") <= modified_after:
+                return False
+        return True
+
+    def sync(self):
+        """
+        Applies to the index the changes of the drive since the last load. If the page token is no longer valid,
+        the files are listed again.
+        :return: number of changes applied, 0 if the files were listed again
+        :raises DriveError: if Drive answers with any other error
+        """
+        with self._lock:
+            get = self._drive_query()
+            get.update({"pageToken": self.page_token,
+                        "pageSize": 1000,
+                        "includeRemoved": "true",
+                        "fields": "nextPageToken,newStartPageToken,"
+                                  "changes(type,fileId,removed,file({},trashed))".format(FILEFIELDS)})
+            count = 0
+            touched = set()
             while True:
-                try:
-                    self.gapi.get(FILESDRIVE, get=get)
-                    data = json.loads(self.gapi.text)
-                except json.decoder.JSONDecodeError:
-                    time.sleep(1)
+                data = self.gapi._request_json("GET", CHANGES, get=get)
+                if "error" in data:
+                    if data["error"].get("code") in (400, 404):  # Invalid or expired page token
+                        self.page_token = None
+                        if self.gapi.cache is not None:
+                            self.gapi.cache.delete("files", self.cache_key)
+                        self.load(True)
+                        return 0
+                    raise DriveError(data["error"])
+                for change in data.get("changes", list()):
+                    touched.update(self._apply_change(change))
+                    count += 1
+                if "nextPageToken" in data:
+                    get.update({"pageToken": data["nextPageToken"]})
                     continue
-                else:
+                self.page_token = data.get("newStartPageToken", get["pageToken"])
+                break
+            if count > 0:
+                self._misses = dict()
+            if count > 0 or self.page_token != get["pageToken"]:
+                self._persist(touched)
+            self.last_loaded = datetime.datetime.now()
+            return count
+
+    def load(self, force=False):
+        with self._lock:
+            if force is True or (force is False and
+                                         self.last_loaded <= datetime.datetime.now() - datetime.timedelta(minutes=5)):
+                if self.incremental is True and self.page_token is None:
+                    self._restore()
+                if self.incremental is True and self.page_token is not None:
+                    self.sync()
+                    return
+                print("Loading Files")
+                if self.drive_name is not None:
+                    if self.is_teamdrive is True:  # TODO
+                        self.gapi._teamdrives_list(self.drive_name)
+                        drives = self.gapi._teamdrives
+                    else:
+                        pass
+                        drives = self.gapi._drives
+                    if self.drive_name not in drives:
+                        raise self.is_teamdrive and TeamDriveNotFoundError() or DriveNotFoundError()
+                    self.drive_id = drives[self.drive_name]
+                elif self.drive_id is None:
+                    self.drive_id = self.gapi._drive_id
+                    self.is_teamdrive = self.gapi._is_teamdrive
+                page_token = None
+                if self.incremental is True:
+                    data = self.gapi._request_json("GET", CHANGESSTART, get=self._drive_query())
+                    if "error" in data:
+                        raise DriveError(data["error"])
+                    page_token = data["startPageToken"]
+                get = self._list_params()
+                files = dict()
+                while True:
+                    data = self.gapi._request_json("GET", FILESDRIVE, get=get)
+                    if "error" in data:  # The index and its cache are kept as they are
+                        raise DriveError(data["error"])
                     if "files" in data:
                         for item in data["files"]:
-                            self[item["name"]] = item
+                            files[item["name"]] = item
                     if "nextPageToken" in data:
                         get.update({"pageToken": data["nextPageToken"]})
                         continue
                     break
-            self.last_loaded = datetime.datetime.now()
-        if self._type is not None:
-            for item in list(self.keys()):
-                if self[item]["mimeType"] != self._type:
-                    del(self[item])
+                self.page_token = page_token
+                dict.clear(self)
+                dict.update(self, files)
+                self._names = dict([(item["id"], name) for name, item in files.items()])
+                self._misses = dict()
+                self._persist()
+                self.last_loaded = datetime.datetime.now()
+            if self._type is not None:
+                for item in list(self.keys()):
+                    if self[item]["mimeType"] != self._type:
+                        del(self[item])
+
+
+class SheetSnapshot(object):
+    """
+    In-memory copy of the values of a sheet, used to serve reads without requesting them again.
+    """
+    def __init__(self, values, dimensions, modified_time=None, ttl=None):
+        """
+        Initializes the snapshot with the given values.
+        :param values: list of lists of values of the sheet, as given by the API
+        :param dimensions: tuple of (columns, rows) of the sheet when it was loaded
+        :param modified_time: modifiedTime of the file in Drive when it was loaded
+        :param ttl: seconds the snapshot is valid for. None to keep it until it is invalidated
+        """
+        self.values = values
+        self.dimensions = dimensions
+        self.modified_time = modified_time
+        self.ttl = ttl
+        self.loaded = datetime.datetime.now()
+        self.checked = self.loaded
+
+    @property
+    def expired(self):
+        """
+        Whether the ttl of the snapshot has passed or not.
+        """
+        if self.ttl is None:
+            return False
+        return self.loaded + datetime.timedelta(seconds=self.ttl) <= datetime.datetime.now()
+
+    def row(self, index):
+        """
+        Gives a copy of the values of the given row.
+        :param index: location begining with 0 of the row
+        :return: list of values, empty if the row has no data
+        """
+        if index < len(self.values):
+            return list(self.values[index])
+        return list()
+
+    def rows(self, init=0, end=None):
+        """
+        Gives a copy of the values of the rows between init and end, both included.
+        :param init: location begining with 0 of the first row
+        :param end: location of the last row. Last row with data by default
+        :return: list of lists of values
+        """
+        if end is None:
+            end = len(self.values) - 1
+        return [list(row) for row in self.values[init:end+1]]
+
+
+class WriteBuffer(object):
+    """
+    Cell edits of a sheet collected locally to be sent together. Later edits of a cell replace earlier ones.
+    """
+    def __init__(self):
+        self.cells = dict()
+        self.clears = set()
+
+    def __len__(self):
+        return len(self.cells) + len(self.clears)
+
+    def clear(self, row, column):
+        """
+        Sets the cell to be cleared.
+        :param row: location begining with 0 of the row
+        :param column: location begining with 0 of the column
+        :return: None
+        """
+        if (row, column) in self.cells:
+            del(self.cells[(row, column)])
+        self.clears.add((row, column))
+
+    def write(self, row, column, value):
+        """
+        Sets the new value of the cell.
+        :param row: location begining with 0 of the row
+        :param column: location begining with 0 of the column
+        :param value: new value of the cell
+        :return: None
+        """
+        self.clears.discard((row, column))
+        self.cells[(row, column)] = value
+
+    def write_row(self, row, values, column=0):
+        """
+        Sets the new values of a row, begining in the given column.
+        :param row: location begining with 0 of the row
+        :param values: list of new values
+        :param column: location begining with 0 of the first column
+        :return: None
+        """
+        for index, value in enumerate(values):
+            self.write(row, column + index, value)
+
+    @staticmethod
+    def coalesce(cells):
+        """
+        Groups cells in the fewest rectangles of contiguous rows with the same contiguous columns.
+        :param cells: dict of {(row, column): value} or iterable of (row, column)
+        :return: list of (first row, first column, last row, last column, list of lists of values) with locations
+                 begining with 0. Values are None if cells is not a dict
+        """
+        runs = list()
+        for row, column in sorted(cells):
+            value = None
+            if isinstance(cells, dict):
+                value = cells[(row, column)]
+            if len(runs) > 0 and runs[-1][0] == row and runs[-1][2] == column - 1:
+                runs[-1][2] = column
+                runs[-1][3].append(value)
+            else:
+                runs.append([row, column, column, [value]])
+        final = list()
+        for row, init, end, values in runs:
+            if len(final) > 0 and final[-1][2] == row - 1 and final[-1][1] == init and final[-1][3] == end:
+                final[-1][2] = row
+                final[-1][4].append(values)
+            else:
+                final.append([row, init, row, end, [values]])
+        return [tuple(item) for item in final]
+
+
+def cell_text(value):
+    """
+    Gives the text a value is shown with in a sheet with the default format, to compare new values with the
+    formatted values read.
+    :param value: value of a cell
+    :return: str
+    """
+    if value is None:
+        return str()
+    elif isinstance(value, bool):
+        return value and "TRUE" or "FALSE"
+    elif isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def cell_data(value):
+    """
+    Gives the CellData of a value entered by the user, for updateCells and appendCells requests.
+    :param value: number, bool, formula beginning with "=", text, or None for an empty cell
+    :return: dict of CellData
+    """
+    if value is None:
+        return dict()
+    elif isinstance(value, bool):
+        return {"userEnteredValue": {"boolValue": value}}
+    elif isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    elif isinstance(value, str) and value.startswith("="):
+        return {"userEnteredValue": {"formulaValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+def row_filter(sheet_id, column, value=None):
+    """
+    Gives the DataFilter of the rows of a sheet tagged with the value of a column by SpreadsheetBatch.tag_rows.
+    :param sheet_id: sheetId of the sheet
+    :param column: name of the column
+    :param value: value of the column. Rows tagged with any value by default
+    :return: dict of DataFilter
+    """
+    lookup = {"locationType": "ROW",
+              "metadataKey": ROWTAG.format(column),
+              "metadataLocation": {"dimensionRange": {"sheetId": sheet_id, "dimension": "ROWS"}},
+              "locationMatchingStrategy": "INTERSECTING_LOCATION"}
+    if value is not None:
+        lookup["metadataValue"] = cell_text(value)
+    return {"developerMetadataLookup": lookup}
+
+
+class SpreadsheetBatch(object):
+    """
+    Structural changes of a spreadsheet collected to be sent in a single batchUpdate request: sheets added with the
+    grid their data needs, deleted, replaced or renamed, and cells written. New sheets are given their sheetId
+    beforehand, so later requests of the same batch may refer to them. The values of added sheets are written as
+    entered by the user, with a values:batchUpdate right after the batchUpdate. Used as a context manager, it is
+    sent on exit.
+    """
+    def __init__(self, gapi, name):
+        """
+        :param gapi: gapi.GoogleAPI instance
+        :param name: name of the spreadsheet
+        """
+        self.gapi = gapi
+        self.name = name
+        self.requests = list()
+        self.values = list()  # (sheetId, list of lists of values) written as entered by the user after the requests
+        self._metadata = dict()  # Characters of developer metadata created for each sheetId
+        file_id = gapi._files_get_id_by_name(name)
+        self._sheets = dict([(title, dict(sheet)) for title, sheet in gapi._spreadsheet_get_index(file_id).items()])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def __len__(self):
+        return len(self.requests)
+
+    def _sheet_id(self, sheet_name):
+        if sheet_name not in self._sheets:
+            raise SheetNotFoundError(sheet_name)
+        return self._sheets[sheet_name]["sheetId"]
+
+    def _new_sheet_id(self):
+        ids = set([sheet["sheetId"] for sheet in self._sheets.values()])
+        while True:
+            sheet_id = random.randint(1, 2 ** 31 - 1)
+            if sheet_id not in ids:
+                return sheet_id
+
+    @staticmethod
+    def _rows(values):
+        return [{"values": [cell_data(value) for value in row]} for row in values]
+
+    def add_sheet(self, title, values=None, *, rows=None, columns=None, index=None):
+        """
+        Adds a sheet, with the given values from A1.
+        :param title: title of the sheet
+        :param values: list of lists of values of the sheet, parsed as if entered by the user: "=" formulas, numbers
+                       and dates in text are converted as the sheet does
+        :param rows: rows of the grid. As many as values by default, at least 1
+        :param columns: columns of the grid. As many as the longest row of values by default, at least 1
+        :param index: position of the sheet. Last by default
+        :return: sheetId of the new sheet
+        """
+        if values is None:
+            values = list()
+        if rows is None:
+            rows = max(1, len(values))
+        if columns is None:
+            columns = max([1] + [len(row) for row in values])
+        sheet_id = self._new_sheet_id()
+        properties = {"sheetId": sheet_id, "title": title, "gridProperties": {"rowCount": rows,
+                                                                               "columnCount": columns}}
+        if index is not None:
+            properties["index"] = index
+        self.requests.append({"addSheet": {"properties": properties}})
+        self._sheets[title] = {"sheetId": sheet_id, "index": index, "rowCount": rows, "columnCount": columns}
+        if len(values) > 0:
+            self.values.append((sheet_id, values))
+        return sheet_id
+
+    def append_cells(self, sheet_name, values):
+        """
+        Appends rows after the last row with data of a sheet, growing its grid if needed.
+        :param sheet_name: title of the sheet
+        :param values: list of lists of values
+        :return: None
+        """
+        self.requests.append({"appendCells": {"sheetId": self._sheet_id(sheet_name), "rows": self._rows(values),
+                                              "fields": "userEnteredValue"}})
+
+    def delete_rows(self, sheet_name, init, end=None):
+        """
+        Deletes rows of a sheet, shifting the following ones up. Requests of a batch are applied in order, so rows
+        are given as they are after the deletes requested before in the same batch: delete them from the last one.
+        :param sheet_name: title of the sheet
+        :param init: first row to delete, beginning with 0
+        :param end: last row to delete. Only init by default
+        :return: None
+        """
+        if end is None:
+            end = init
+        self.requests.append({"deleteDimension": {"range": {"sheetId": self._sheet_id(sheet_name),
+                                                            "dimension": "ROWS",
+                                                            "startIndex": init,
+                                                            "endIndex": end + 1}}})
+
+    def delete_sheet(self, sheet_name):
+        """
+        Deletes a sheet.
+        :param sheet_name: title of the sheet
+        :return: None
+        """
+        self.requests.append({"deleteSheet": {"sheetId": self._sheet_id(sheet_name)}})
+        del(self._sheets[sheet_name])
+
+    def replace_sheet(self, sheet_name, values=None):
+        """
+        Replaces a sheet, or adds it if it does not exist, with a new one with the given values. The new sheet takes
+        the place of the old one, which is deleted after the new one is added, so the only sheet may be replaced.
+        :param sheet_name: title of the sheet
+        :param values: list of lists of values of the sheet, parsed as if entered by the user
+        :return: sheetId of the new sheet
+        """
+        if sheet_name not in self._sheets:
+            return self.add_sheet(sheet_name, values)
+        old = self._sheets[sheet_name]
+        temporary = "{}~{}".format(sheet_name, self._new_sheet_id())
+        sheet_id = self.add_sheet(temporary, values, index=old["index"])
+        self.delete_sheet(sheet_name)
+        self.update_sheet_properties(temporary, title=sheet_name)
+        return sheet_id
+
+    def tag_rows(self, sheet_name, column, values, *, row=0):
+        """
+        Tags rows of a sheet with developer metadata holding the value of one of their columns, so they are found
+        by Sheet.find and Sheet.where without reading the sheet. Tags follow their rows when rows are moved, and are
+        deleted with them. Rows with an empty value are not tagged. The Sheets API allows METADATALIMIT characters
+        of keys and values of developer metadata for a sheet, so the tags of a batch taking more are not sent.
+        :param sheet_name: title of the sheet
+        :param column: name of the column
+        :param values: values of the column, one for each row
+        :param row: row of the first value, beginning with 0
+        :return: None
+        :raises SheetError: if the tags of the sheet in the batch take more than METADATALIMIT characters
+        """
+        sheet_id = self._sheet_id(sheet_name)
+        key = ROWTAG.format(column)
+        tags = [(offset, cell_text(value)) for offset, value in enumerate(values) if value is not None and value != ""]
+        size = self._metadata.get(sheet_id, 0) + sum([len(key) + len(text) for offset, text in tags])
+        if size > METADATALIMIT:
+            raise SheetError("Tags of {} would take {} characters of developer metadata, over the {} allowed for a "
+                             "sheet".format(sheet_name, size, METADATALIMIT))
+        self._metadata[sheet_id] = size
+        for offset, text in tags:
+            location = {"dimensionRange": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": row + offset,
+                                           "endIndex": row + offset + 1}}
+            self.requests.append({"createDeveloperMetadata": {"developerMetadata": {
+                "metadataKey": key, "metadataValue": text, "location": location,
+                "visibility": "DOCUMENT"}}})
+
+    def untag_rows(self, sheet_name, column):
+        """
+        Deletes the tags of the rows of a sheet made by tag_rows for a column.
+        :param sheet_name: title of the sheet
+        :param column: name of the column
+        :return: None
+        """
+        self.requests.append({"deleteDeveloperMetadata": {"dataFilter": row_filter(self._sheet_id(sheet_name),
+                                                                                   column)}})
+
+    def update_cells(self, sheet_name, values, *, row=0, column=0):
+        """
+        Writes values in a sheet from the given cell.
+        :param sheet_name: title of the sheet
+        :param values: list of lists of values
+        :param row: row of the first cell, beginning with 0
+        :param column: column of the first cell, beginning with 0
+        :return: None
+        """
+        self.requests.append({"updateCells": {"start": {"sheetId": self._sheet_id(sheet_name), "rowIndex": row,
+                                                        "columnIndex": column},
+                                              "rows": self._rows(values),
+                                              "fields": "userEnteredValue"}})
+
+    def update_sheet_properties(self, sheet_name, **properties):
+        """
+        Updates properties of a sheet, like title, index, hidden or gridProperties.
+        :param sheet_name: title of the sheet
+        :param properties: properties to update
+        :return: None
+        """
+        sheet_id = self._sheet_id(sheet_name)
+        self.requests.append({"updateSheetProperties": {"properties": dict(properties, sheetId=sheet_id),
+                                                        "fields": ",".join(properties.keys())}})
+        if "title" in properties:
+            self._sheets[properties["title"]] = self._sheets.pop(sheet_name)
+
+    def commit(self):
+        """
+        Sends the collected requests in a single batchUpdate, followed by a values:batchUpdate with the values of the
+        added sheets, if any.
+        :return: list of replies of the requests
+        """
+        if len(self.requests) == 0:
+            return list()
+        requests, self.requests = self.requests, list()
+        values, self.values = self.values, list()
+        self._metadata = dict()
+        replies = self.gapi.spreadsheet_batch_update(requests, name=self.name)
+        titles = dict([(sheet["sheetId"], title) for title, sheet in self._sheets.items()])
+        data = [(str(A1Range(titles[sheet_id], 0, 0, len(item) - 1, max([1] + [len(row) for row in item]) - 1)), item)
+                for sheet_id, item in values if sheet_id in titles]
+        if len(data) > 0:
+            self.gapi.spreadsheet_batch_update_values(data, name=self.name)
+        return replies
+
+
+def column_dtype(values):
+    """
+    Gives the type of a column of unformatted values: "bool" or "int64" if every cell has a value of that type,
+    "float64" if every value is a number, empty cells included, and "object" otherwise.
+    :param values: list of values of the column. Empty cells are None or ""
+    :return: name of the numpy dtype of the column
+    """
+    kinds = set([type(value) for value in values if value is not None and value != ""])
+    empty = len(values) == 0 or any([value is None or value == "" for value in values])
+    if kinds == {bool} and empty is False:
+        return "bool"
+    elif kinds == {int} and empty is False:
+        return "int64"
+    elif len(kinds) > 0 and kinds <= {int, float}:
+        return "float64"
+    return "object"
+
+
+def serial_to_datetime(value):
+    """
+    Decodes a date rendered as SERIAL_NUMBER.
+    :param value: days since 1899-12-30, with the time as a fraction of day
+    :return: datetime.datetime instance, or None for empty cells
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return SERIALEPOCH + datetime.timedelta(days=value)
+    return None
 
 
 class Apps(object):
@@ -264,16 +1390,15 @@ class Spreadsheets(Apps):
 
             def __getitem__(self, key):
                 """
-                list.__getitem__ overriding to get remote data if it is locally a function
+                list.__getitem__ overriding to get remote data if it is locally a function. Every function in the
+                row, or in the slice, is resolved in a single request.
                 :param key: index of key to search for.
                 :return: value or method searched.
                 """
-                item = list.__getitem__(self, key)
-                if not isinstance(item, list):
-                    if list.__getitem__(self, key).startswith("="):
-                        list.__setitem__(self, key,
-                                         self.spreadsheet.get_range(self.spreadsheet.get_range_name(key+1,
-                                                                                                    self._index+1)))
+                if isinstance(key, slice):
+                    self.resolve(range(len(self))[key])
+                elif self._is_formula(list.__getitem__(self, key)):
+                    self.resolve()
                 return list.__getitem__(self, key)
 
             def __setitem__(self, key, value):
@@ -283,24 +1408,33 @@ class Spreadsheets(Apps):
                 :param value: new velue to set
                 :return: None
                 """
-                self._sheet.update_range(self._sheet.get_range_name(int(key)+1, int(self._index)+1), [[value]])
-                if isinstance(value, str) and value.startswith("="):
-                    value = "Cargando..."
-                    while value not in ("Cargando...", "Loading..."):
-                        time.sleep(1)
-                        value = self.spreadsheet.get_range(self.spreadsheet.get_range_name(key+1, self._index+1))
+                if self._sheet.buffer is not None:
+                    self._sheet.buffer.write(int(self._index), int(key), value)
+                    if key >= len(self):
+                        super().extend(["" for i in range(key-len(self)+1)])
+                    return super().__setitem__(key, value)
+                values = self._sheet.update_range(str(A1Range.cell(self.sheet_name, int(self._index), int(key))),
+                                                  [[value]])
+                if self._is_formula(value):
+                    value = len(values) > 0 and len(values[0]) > 0 and values[0][0] or ""
                 if key >= len(self):
                     super().extend(["" for i in range(key-len(self))]+[value])
                 super().__setitem__(key, value)
 
             def __delitem__(self, key):
-                self._sheet.clear_range(self._sheet.get_range_name(key + 1, self._index + 1))
+                if self._sheet.buffer is not None:
+                    self._sheet.buffer.clear(int(self._index), int(key))
+                else:
+                    self._sheet.clear_range(str(A1Range.cell(self.sheet_name, self._index, key)))
                 super().__setitem__(key, "")
 
+            @staticmethod
+            def _is_formula(item):
+                return isinstance(item, str) and item.startswith("=")
+
             @property
             def range(self):
-                return self.sheet_name+"!"+self.spreadsheet.get_range_name(1, self.row_index+1) + \
-                       ":"+self.spreadsheet.get_range_name(len(self)+1, self.row_index+1)
+                return str(A1Range.rows_of(self.sheet_name, self.row_index, self.row_index, len(self) + 1))
 
             @property
             def row_index(self):
@@ -314,20 +1448,58 @@ class Spreadsheets(Apps):
             def spreadsheet(self):
                 return self._sheet.spreadsheet
 
+            def resolve(self, keys=None):
+                """
+                Gets remotely the values of the cells which are locally a function, in a single request.
+                :param keys: indexes of the cells to resolve. Whole row by default
+                :return: None
+                """
+                if keys is None:
+                    keys = range(len(self))
+                keys = [key for key in keys if self._is_formula(list.__getitem__(self, key))]
+                if len(keys) > 0:
+                    ranges = [str(A1Range.cell(self.sheet_name, self._index, key)) for key in keys]
+                    for key, values in zip(keys, self.spreadsheet.get_ranges(ranges)):
+                        if len(values) > 0 and len(values[0]) > 0:
+                            list.__setitem__(self, key, values[0][0])
+                        else:
+                            list.__setitem__(self, key, "")
+
             def update(self, values):
-                cols, rows = self._sheet.get_sheet_dimensions()
-                self._sheet.update_range(self._sheet.get_range_name(1, self._index + 1)+":"+
-                                         self._sheet.get_range_name(1, cols),
+                if self._sheet.buffer is not None:
+                    self._sheet.buffer.write_row(int(self._index), values)
+                    return
+                cols, rows = self._sheet.get_sheet_dimensions(self.sheet_name)
+                self._sheet.update_range(str(A1Range.rows_of(self.sheet_name, self._index, self._index, cols)),
                                          [values])
 
-        def __init__(self, sheet_name, gapi, name, spreadsheet):
+        def __init__(self, sheet_name, gapi, name, spreadsheet, *, cache=None):
+            """
+            Initializes the Sheet and opens it remotely.
+            :param sheet_name: title of the sheet
+            :param gapi: gapi.GoogleAPI instance
+            :param name: name of the spreadsheet
+            :param spreadsheet: gapi.Spreadsheets instance the sheet belongs to
+            :param cache: whether reads are served from a snapshot of the sheet. True to cache it until it is
+                          invalidated, a number of seconds to cache it for, False to disable it. None to use
+                          gapi.GoogleAPI.sheet_cache
+            """
             Apps.__init__(self, gapi, name)
             self._app_name = "spreadsheet"
             self._sheet_name = sheet_name
             self._spreadsheet = spreadsheet
+            self._cache = cache
+            self._buffer = None
             Apps.__getattribute__(self, "api").spreadsheet_open_sheet(self.sheet_name, name=self.name)
             self._iter_index = 0
 
+        @property
+        def buffer(self):
+            """
+            Gives the gapi.WriteBuffer collecting edits inside Sheet.batch, or None if edits are sent at once.
+            """
+            return self._buffer
+
         @property
         def sheet_name(self):
             return self._sheet_name
@@ -341,15 +1513,21 @@ class Spreadsheets(Apps):
             return Apps.__getattr__(self, item)
 
         def __getitem__(self, key):
-            cols, rows = Apps.__getattribute__(self, "api").spreadsheet_get_sheet_dimensions(self.sheet_name,
-                                                                                             name=self.name)
-            Apps.__getattribute__(self, "api").spreadsheet_open_sheet(self.sheet_name, name=self.name)
+            snapshot = self.snapshot()
+            if snapshot is not None:
+                cols, rows = snapshot.dimensions
+            else:
+                cols, rows = Apps.__getattribute__(self, "api").spreadsheet_get_sheet_dimensions(self.sheet_name,
+                                                                                                 name=self.name)
+                Apps.__getattribute__(self, "api").spreadsheet_open_sheet(self.sheet_name, name=self.name)
             if isinstance(key, int):
                 if key < 0:
                     key = rows + key
                 if key < rows and key >= 0:
+                    if snapshot is not None:
+                        return self.row(key, snapshot.row(key))
                     return self.row(key,
-                                    self.get_range("A" + str(key + 1) + ":" + self.get_range_name(cols, key + 1))[0])
+                                    self.get_range(str(A1Range.rows_of(self.sheet_name, key, key, cols)))[0])
                 else:
                     raise IndexError()
             elif isinstance(key, slice):
@@ -364,14 +1542,21 @@ class Spreadsheets(Apps):
                 if end < 0:
                     end = rows + end
                 if init < end < rows and end >= init >= 0:
+                    if snapshot is not None:
+                        return self.row(key, snapshot.rows(init, end) or [[]])
                     return self.row(key,
-                                    self.get_range("A" + str(init + 1) + ":" + self.get_range_name(cols, end + 1)))
+                                    self.get_range(str(A1Range.rows_of(self.sheet_name, init, end, cols))))
                 else:
                     raise IndexError()
 
 
         def __setitem__(self, key, values):
             assert isinstance(values, list)
+            if self.buffer is not None:
+                if key < 0:
+                    cols, rows = self.get_sheet_dimensions(self.sheet_name)
+                    key = rows + key
+                return self.buffer.write_row(key, values)
             values = [values]
             cols, rows = Apps.__getattribute__(self, "api").spreadsheet_get_sheet_dimensions(self.sheet_name,
                                                                                              name=self.name)
@@ -379,7 +1564,7 @@ class Spreadsheets(Apps):
             if key < 0:
                 key = rows + key
             if key < rows and key >= 0:
-                return self.update_range("A"+str(key+1)+":"+self.get_range_name(cols, key+1), values)
+                return self.update_range(str(A1Range.rows_of(self.sheet_name, key, key, cols)), values)
             else:
                 raise IndexError()
 
@@ -387,7 +1572,7 @@ class Spreadsheets(Apps):
             return str(self.get_sheet_values())
 
         def __iter__(self):
-            return self.__next__()
+            return self.iter_rows()
 
         def __next__(self):
             data = self.get_sheet_values()
@@ -403,8 +1588,18 @@ class Spreadsheets(Apps):
                 return data[0]
             """
 
-        def append_rows(self, values):
-            updated_range = self.spreadsheet.append_rows("A1", values)
+        def append_rows(self, values, *, tag=None):
+            """
+            Appends rows after the last row with data of the sheet.
+            :param values: list of lists of values, each list being a new row
+            :param tag: name, or list of names, of the columns to tag the new rows with, so they are found by
+                        Sheet.find and Sheet.where. Tagging takes two further requests: one getting the first row,
+                        to locate the columns, and a batchUpdate with the tags
+            :return: the updated range in "A1" notation
+            """
+            updated_range = self.spreadsheet.append_rows(str(A1Range.cell(self.sheet_name, 0, 0)), values)
+            if tag is not None and isinstance(updated_range, str):
+                self._tag_rows(tag, values, A1Range.parse(updated_range).start_row)
             return updated_range
             """ #TODO Review
             if isinstance(updated_range, str):
@@ -428,12 +1623,276 @@ class Spreadsheets(Apps):
                 return updated_range
             """
 
-        def get_sheet_values(self):
-            return self.spreadsheet.get_sheet_values(self.sheet_name, name=self.name)
+        @contextmanager
+        def batch(self):
+            """
+            Context manager to collect cell edits, row updates and clears of the sheet and send them on exit with
+            Sheet.flush. Nested batches are sent when the outermost one exits.
+            """
+            if self._buffer is not None:
+                yield self
+                return
+            self._buffer = WriteBuffer()
+            try:
+                yield self
+                self.flush()
+            finally:
+                self._buffer = None
 
-        def row(self, key, range):
+        def flush(self):
+            """
+            Sends the edits collected in the buffer, merged in a values:batchUpdate and a values:batchClear request.
+            :return: None
+            """
+            buffer = self.buffer
+            if buffer is None or len(buffer) == 0:
+                return
+            api = Apps.__getattribute__(self, "api")
+            data = list()
+            for init_row, init_col, end_row, end_col, values in WriteBuffer.coalesce(buffer.cells):
+                data.append((str(A1Range(self.sheet_name, init_row, init_col, end_row, end_col)), values))
+            ranges = list()
+            for init_row, init_col, end_row, end_col, values in WriteBuffer.coalesce(buffer.clears):
+                ranges.append(str(A1Range(self.sheet_name, init_row, init_col, end_row, end_col)))
+            if len(ranges) > 0:
+                api.spreadsheet_batch_clear(ranges, name=self.name)
+            if len(data) > 0:
+                api.spreadsheet_batch_update_values(data, name=self.name)
+            self._buffer = WriteBuffer()
+
+        def find(self, column, value):
+            """
+            Finds the first row with the given value in a column among the rows tagged for that column, getting only
+            the matching rows from the server.
+            :param column: name of the column, as given in the first row
+            :param value: value to find
+            :return: gapi.Spreadsheets.Sheet.Row instance, or None if no row is found
+            """
+            rows = self.where({column: value})
+            if len(rows) > 0:
+                return rows[0]
+            return None
+
+        def where(self, conditions):
+            """
+            Finds the rows matching every condition among the rows tagged for their columns, in a single
+            values:batchGetByDataFilter request, so only the matching rows and the first one are got. Rows whose
+            values changed after being tagged are left out.
+            :param conditions: dict of {name of column: value}
+            :return: list of gapi.Spreadsheets.Sheet.Row instances, in the order of the sheet
+            """
+            api = Apps.__getattribute__(self, "api")
+            return [self.row(index, values)
+                    for index, values in api.spreadsheet_find_rows(self.sheet_name, conditions, name=self.name)]
+
+        def tag(self, columns):
+            """
+            Tags every row of the sheet but the first one with the value of the given columns, dropping former tags
+            of these columns, so they are found by Sheet.find and Sheet.where. The columns are got in a single request
+            and the tags sent in a single batchUpdate. The Sheets API allows METADATALIMIT (30,000) characters of
+            developer metadata for a sheet, keys of the tags included, so only sheets of a few thousand rows can be
+            tagged, and only by the columns identifying the rows. Tags over the limit raise SheetError before any
+            request is sent.
+            :param columns: name, or list of names, of the columns
+            :return: None
+            """
+            if isinstance(columns, str):
+                columns = [columns]
+            api = Apps.__getattribute__(self, "api")
+            positions = self._column_positions(columns)
+            data = api.spreadsheet_get_ranges([str(A1Range(self.sheet_name, 1, position, None, position))
+                                               for position in positions], name=self.name)
+            with self.spreadsheet.batch_update() as batch:
+                for column, values in zip(columns, data):
+                    batch.untag_rows(self.sheet_name, column)
+                    batch.tag_rows(self.sheet_name, column, [row[0] if len(row) > 0 else "" for row in values], row=1)
+
+        def _column_positions(self, columns):
+            api = Apps.__getattribute__(self, "api")
+            header = api.spreadsheet_get_range(str(A1Range(self.sheet_name, 0, None, 0, None)), name=self.name)[0]
+            for column in columns:
+                if column not in header:
+                    raise KeyError(column)
+            return [header.index(column) for column in columns]
+
+        def _tag_rows(self, columns, values, row):
+            if isinstance(columns, str):
+                columns = [columns]
+            positions = self._column_positions(columns)
+            with self.spreadsheet.batch_update() as batch:
+                for column, position in zip(columns, positions):
+                    batch.tag_rows(self.sheet_name, column,
+                                   [item[position] if position < len(item) else "" for item in values], row=row)
+
+        def get_sheet_values(self):
+            snapshot = self.snapshot()
+            if snapshot is not None:
+                return snapshot.rows()
+            return self.spreadsheet.get_sheet_values(self.sheet_name, name=self.name)
+
+        def to_columns(self, *, header=True, dates=None):
+            """
+            Gets the sheet by columns, with unformatted values, in a single request.
+            :param header: whether the first row has the names of the columns. Columns are named by letter if not
+            :param dates: names of the columns with dates, decoded from serial numbers to datetime.datetime
+            :return: dict of {name of column: list of values}, empty cells as None and every column as long as the
+                     longest one
+            """
+            api = Apps.__getattribute__(self, "api")
+            columns = api.spreadsheet_get_columns(self.sheet_name, name=self.name)
+            if dates is None:
+                dates = list()
+            final = dict()
+            for index, column in enumerate(columns):
+                key = column_letters(index)
+                if header is True:
+                    if len(column) > 0 and column[0] not in (None, "") and str(column[0]) not in final:
+                        key = str(column[0])
+                    column = column[1:]
+                column = [value if value != "" else None for value in column]
+                if key in dates:
+                    column = [serial_to_datetime(value) for value in column]
+                final[key] = column
+            return final
+
+        def to_numpy(self, *, header=True, dates=None):
+            """
+            Gets the sheet by columns as typed numpy arrays: bool, int64 or float64 for numbers, with NaN in empty
+            cells, datetime64 for the columns in dates, with NaT in empty cells, and object for anything else.
+            :param header: whether the first row has the names of the columns. Columns are named by letter if not
+            :param dates: names of the columns with dates
+            :return: dict of {name of column: numpy.ndarray}
+            """
+            if numpy is None:
+                raise ImportError("numpy is needed to export sheets to numpy")
+            if dates is None:
+                dates = list()
+            columns = self.to_columns(header=header)
+            final = dict()
+            for key, column in columns.items():
+                dtype = column_dtype(column)
+                if key in dates:
+                    serials = numpy.array([value if serial_to_datetime(value) is not None else numpy.nan
+                                           for value in column], dtype="float64")
+                    array = numpy.datetime64(SERIALEPOCH, "ms") + \
+                        numpy.round(numpy.nan_to_num(serials) * 86400000).astype("int64").astype("timedelta64[ms]")
+                    array[numpy.isnan(serials)] = numpy.datetime64("NaT")
+                elif dtype == "float64":
+                    array = numpy.array([value if value is not None else numpy.nan for value in column],
+                                        dtype="float64")
+                else:
+                    array = numpy.array(column, dtype=dtype)
+                final[key] = array
+            return final
+
+        def iter_rows(self, page_size=PAGESIZE, *, prefetch=True):
+            """
+            Iterates the rows of the sheet getting them in windows of page_size rows, so the whole sheet is never
+            held in memory. Rows are served from the snapshot if the sheet is cached.
+            :param page_size: rows got in each request
+            :param prefetch: whether to get the next window in background while the current one is iterated
+            :return: generator of gapi.Spreadsheets.Sheet.Row instances
+            """
+            snapshot = self.snapshot()
+            if snapshot is not None:
+                rows = enumerate(snapshot.rows())
+            else:
+                rows = enumerate(Apps.__getattribute__(self, "api").spreadsheet_iter_rows(
+                    self.sheet_name, name=self.name, page_size=page_size, prefetch=prefetch))
+            for index, values in rows:
+                yield self.row(index, values)
+
+        def invalidate(self):
+            """
+            Discards the cached snapshot of the sheet, so next read gets it again.
+            """
+            Apps.__getattribute__(self, "api").spreadsheet_invalidate_snapshot(self.sheet_name, name=self.name)
+
+        def row(self, key, range):
             return Spreadsheets.Sheet.Row(key, range, self)
 
+        def snapshot(self):
+            """
+            Gives the snapshot the reads of the sheet are served from.
+            :return: gapi.SheetSnapshot instance, or None if the sheet is not cached
+            """
+            api = Apps.__getattribute__(self, "api")
+            cache = self._cache
+            if cache is None:
+                cache = api.sheet_cache
+            if cache is False:
+                return None
+            ttl = None
+            if cache is not True:
+                ttl = cache
+            return api.spreadsheet_get_snapshot(self.sheet_name, name=self.name, ttl=ttl)
+
+        def sync(self, values, key_columns=None):
+            """
+            Makes the sheet hold the given values sending only what changed from the last known snapshot of the
+            sheet: changed cells coalesced in the fewest ranges of a values:batchUpdate, rows left over cleared, or
+            deleted if rows are matched by key, in a separate request, and new rows appended. Values are compared
+            with the text they are shown with, so formulas are always written again. Rows matched by key keep their
+            order in the sheet, whatever their order in values, and rows with new keys are appended at the bottom.
+            :param values: list of lists of values the sheet must hold, in this order if rows are matched by position
+            :param key_columns: index, or list of indexes, of the columns identifying each row. Rows are matched by
+                                position if not given
+            :return: dict with the number of "updated" cells and "appended" and "removed" rows
+            """
+            api = Apps.__getattribute__(self, "api")
+            old = api.spreadsheet_get_snapshot(self.sheet_name, name=self.name).rows()
+            if isinstance(key_columns, int):
+                key_columns = [key_columns]
+            if key_columns is None:
+                pairs = list(zip(range(len(old)), values))
+                appended = values[len(old):]
+                removed = list(range(len(values), len(old)))
+            else:
+                def key(row):
+                    return tuple([cell_text(row[column] if column < len(row) else None) for column in key_columns])
+
+                positions = dict()
+                for index, row in enumerate(old):
+                    positions.setdefault(key(row), list()).append(index)
+                pairs = list()
+                appended = list()
+                for row in values:
+                    if len(positions.get(key(row), list())) > 0:
+                        pairs.append((positions[key(row)].pop(0), row))
+                    else:
+                        appended.append(row)
+                removed = sorted([index for indexes in positions.values() for index in indexes])
+            updated = 0
+            with self.batch():
+                buffer = self.buffer
+                for index, row in pairs:
+                    previous = old[index]
+                    for column in range(max(len(previous), len(row))):
+                        text = column < len(previous) and previous[column] or str()
+                        if column >= len(row) or row[column] is None or row[column] == "":
+                            if text != "":
+                                buffer.clear(index, column)
+                                updated += 1
+                        elif cell_text(row[column]) != text or Spreadsheets.Sheet.Row._is_formula(row[column]):
+                            buffer.write(index, column, row[column])
+                            updated += 1
+                if key_columns is None:
+                    width = max([len(row) for row in old] + [0])
+                    for index in removed:
+                        for column in range(width):
+                            buffer.clear(index, column)
+            if key_columns is not None and len(removed) > 0:
+                with self.spreadsheet.batch_update() as batch:
+                    for init, end in reversed([(item[0], item[2]) for item in WriteBuffer.coalesce(
+                            [(index, 0) for index in removed])]):
+                        batch.delete_rows(self.sheet_name, init, end)
+            if len(appended) > 0:
+                end = len(old)
+                if key_columns is not None:
+                    end -= len(removed)
+                api.spreadsheet_append_rows(str(A1Range.cell(self.sheet_name, end, 0)), appended, name=self.name)
+            return {"updated": updated, "appended": len(appended), "removed": len(removed)}
+
         def update_rows(self, location, values):
             updated_range = self.spreadsheet.append_rows(location, values, insert_data="OVERWRITE")
             return values
@@ -448,19 +1907,19 @@ class Spreadsheets(Apps):
     def __setitem__(self, item, values=None):
         if values:
             if isinstance(values, Spreadsheets.Sheet):
-                values = values.get_rows
+                values = values.get_sheet_values()
             assert isinstance(values, list)
             assert all([isinstance(value, list) for value in values])
-        try:
-            sheet = self.sheet(item)
-        except (SheetNotFoundError, SheetError):
-            pass
-        else:
-            del(self[item])
-        self.add_sheet(item)
-        sheet = self.sheet(item)
-        if values:
-            sheet.append_rows(values)
+        with self.batch_update() as batch:
+            batch.replace_sheet(item, values or None)
+
+    def batch_update(self):
+        """
+        Gives a builder of structural changes of the spreadsheet, sent in a single request by its commit, or on
+        exit when used as a context manager.
+        :return: gapi.SpreadsheetBatch instance
+        """
+        return SpreadsheetBatch(self.api, self.name)
 
     def __delitem__(self, item):
         try:
@@ -503,8 +1962,8 @@ class Spreadsheets(Apps):
     def url(self):
         return self.resource["spreadsheetUrl"]
 
-    def sheet(self, sheet):
-        return Spreadsheets.Sheet(sheet, self.api, self.name, self)
+    def sheet(self, sheet, *, cache=None):
+        return Spreadsheets.Sheet(sheet, self.api, self.name, self, cache=cache)
 
 
 class DebugRequests(Requests):
@@ -512,26 +1971,249 @@ class DebugRequests(Requests):
         Requests.__init__(self)
         self.debug = debug
 
-    def request(self, method, url, *, data=None, json=None, headers=None, get=None):
-        request = Requests.request(self, method, url, data=data, json=json, headers=headers, get=get)
-        if self.debug:
-            with open("log.txt", "a") as f:
-                fp = partial(print, file=f)
-                fp(method, url)
-                fp(datetime.datetime.now())
-                fp(f"Data: {data}")
-                fp(f"JSON: {json}")
-                fp(f"Headers: {headers}")
-                fp(f"Get: {get}")
-                fp(f"Result: {request}")
-                fp()
-        return request
+
+def endpoint_template(url):
+    """
+    Gives the url without query and with ids and ranges replaced by placeholders, to group requests by endpoint.
+    :param url: requested url
+    :return: endpoint template, like "https://sheets.googleapis.com/v4/spreadsheets/{id}/values/{range}"
+    """
+    url = url.split("?", 1)[0]
+    url = re.sub(r"/values/.+?(:append|:clear)?$", r"/values/{range}\1", url)
+    return re.sub(r"/[A-Za-z0-9_-]{19,}(?=/|:|$)", "/{id}", url)
+
+
+class RequestEvent(object):
+    """
+    Event given to the hooks of gapi.GoogleAPI for each call, once it is answered or its retries are exhausted.
+    """
+    def __init__(self, method, url, *, status_code=None, latency=0, bytes_out=0, bytes_in=0, retries=0, error=None):
+        """
+        :param method: HTTP method of the request
+        :param url: requested url
+        :param status_code: status of the last response, None if no response was got
+        :param latency: seconds from the first attempt to the last response, backoffs included
+        :param bytes_out: bytes of the body sent in each attempt
+        :param bytes_in: bytes of the last response
+        :param retries: number of retries made
+        :param error: exception which ended the call, if any
+        """
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint_template(url)
+        self.status_code = status_code
+        self.latency = latency
+        self.bytes_out = bytes_out
+        self.bytes_in = bytes_in
+        self.retries = retries
+        self.error = error
+
+    def as_dict(self):
+        return {"method": self.method, "endpoint": self.endpoint, "status_code": self.status_code,
+                "latency": self.latency, "bytes_out": self.bytes_out, "bytes_in": self.bytes_in,
+                "retries": self.retries, "error": self.error is not None and repr(self.error) or None}
+
+
+class MetricsCollector(object):
+    """
+    Hook of gapi.GoogleAPI keeping in memory, for each method and endpoint, the number of calls, statuses, bytes,
+    retries and a histogram of latencies.
+    """
+    def __init__(self, buckets=LATENCYBUCKETS):
+        """
+        :param buckets: upper bounds in seconds of the buckets of the latency histogram
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._metrics = dict()
+
+    def __call__(self, event):
+        key = (event.method, event.endpoint)
+        with self._lock:
+            if key not in self._metrics:
+                self._metrics[key] = {"count": 0, "errors": 0, "statuses": dict(), "bytes_out": 0, "bytes_in": 0,
+                                      "retries": 0, "latency": 0, "histogram": [0] * (len(self.buckets) + 1)}
+            metrics = self._metrics[key]
+            metrics["count"] += 1
+            if event.error is not None:
+                metrics["errors"] += 1
+            metrics["statuses"][event.status_code] = metrics["statuses"].get(event.status_code, 0) + 1
+            metrics["bytes_out"] += event.bytes_out
+            metrics["bytes_in"] += event.bytes_in
+            metrics["retries"] += event.retries
+            metrics["latency"] += event.latency
+            for index, bound in enumerate(self.buckets):
+                if event.latency <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            metrics["histogram"][index] += 1
+
+    def percentile(self, method, endpoint, percent):
+        """
+        Estimates a percentile of the latency of an endpoint from the histogram.
+        :param method: HTTP method
+        :param endpoint: endpoint template, as given by gapi.endpoint_template
+        :param percent: percentile to estimate, from 0 to 100
+        :return: upper bound in seconds of the bucket of the percentile, inf if it is over the last bucket, None if
+                 the endpoint was not called
+        """
+        with self._lock:
+            metrics = self._metrics.get((method, endpoint))
+            if metrics is None:
+                return None
+            target = metrics["count"] * percent / 100
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), metrics["histogram"]):
+                total += count
+                if total >= target:
+                    return bound
+
+    def reset(self):
+        with self._lock:
+            self._metrics = dict()
+
+    def summary(self):
+        """
+        Gives a copy of the metrics collected.
+        :return: dict of {(method, endpoint template): dict of metrics}
+        """
+        with self._lock:
+            return dict([(key, dict(value, statuses=dict(value["statuses"]), histogram=list(value["histogram"])))
+                         for key, value in self._metrics.items()])
+
+
+class LoggingSink(object):
+    """
+    Hook of gapi.GoogleAPI logging each call, with its data as a dict in the "gapi" attribute of the record.
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        """
+        :param logger: logging.Logger to log to. "zashel.gapi" logger by default
+        :param level: level of the records
+        """
+        if logger is None:
+            logger = logging.getLogger("zashel.gapi")
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s %s %s %.3fs", event.method, event.endpoint, event.status_code,
+                            event.latency, extra={"gapi": event.as_dict()})
+
+
+class Response(object):
+    """
+    Response of a request made by gapi.GoogleAPI, kept apart for each call.
+    """
+    def __init__(self, session, text, retries=0):
+        """
+        Initializes the response with the data of the last request of the given session.
+        :param session: gapi.DebugRequests instance which made the request
+        :param text: text of the response
+        :param retries: number of retries made to get the response
+        """
+        self.status_code = int(session.status_code)
+        self.text = text
+        self.retries = retries
+        self._session = session
+
+    @property
+    def body(self):
+        """
+        Gives the raw body of the response. Only valid until the session makes another request.
+        """
+        return self._session.body
+
+    def header(self, header):
+        """
+        Gives the value of a header of the response. Only valid until the session makes another request.
+        :param header: name of the header, case insensitive
+        :return: value of the header, None if it is not in the response
+        """
+        return self.headers().get(header.lower())
+
+    def headers(self):
+        """
+        Gives the headers of the response, read with GetAllResponseHeaders of the WinHttpRequest object of the
+        session. Only valid until the session makes another request.
+        :return: dict of {name of header in lower case: value}
+        """
+        for item in [self._session] + list(vars(self._session).values()):
+            if hasattr(item, "GetAllResponseHeaders"):
+                break
+        else:
+            raise HeadersNotAvailableError("{} gives no WinHttpRequest object to read headers from".format(
+                type(self._session).__name__))
+        headers = dict()
+        for line in str(item.GetAllResponseHeaders()).splitlines():
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return headers
+
+    def retry_after(self):
+        """
+        Gives the seconds asked to wait by the Retry-After header of the response.
+        :return: seconds to wait, None if the header is not in the response or headers can not be read
+        """
+        try:
+            retry_after = self.header("Retry-After")
+        except HeadersNotAvailableError as error:
+            logging.getLogger("zashel.gapi").warning("Retry-After ignored: %s", error)
+            return None
+        if retry_after is None:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            try:
+                date = email.utils.parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                return None
+            return max(0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class ThreadLocal(object):
+    """
+    Attribute of gapi.GoogleAPI with a value for each thread, for the state of the calls in course.
+    """
+    def __init__(self, default=None):
+        self.default = default
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance._local, self.name, self.default)
+
+    def __set__(self, instance, value):
+        setattr(instance._local, self.name, value)
 
 
 class GoogleAPI(DebugRequests):
-    def __init__(self, *, scopes, secret_file=None, secret_data=None, password=None, debug=False):
+    """
+    Client of Google APIs. It may be shared between threads: each thread requests through its own connection, and
+    the opened file and sheet, and the last response, are kept for each thread. The opened drive is shared, so it is
+    to be chosen with GoogleAPI.teamdrive_open before the client is shared.
+    """
+    _file_id = ThreadLocal()
+    _opened_sheet = ThreadLocal()
+    retries = ThreadLocal(0)
+    _retrying = ThreadLocal()
+    session_class = DebugRequests  # Called with debug to make the connection of each thread
+
+    def __init__(self, *, scopes, secret_file=None, secret_data=None, password=None, debug=False, sheet_cache=False,
+                 retry=None, incremental=False, cache=None, rate_limit=None):
         if secret_file is not None:
             assert os.path.exists(secret_file)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._secret = None
+        self._login_serial = 0
         DebugRequests.__init__(self, debug)
         self.scopes = scopes
         self.secret_file = secret_file
@@ -545,8 +2227,7 @@ class GoogleAPI(DebugRequests):
         self._is_teamdrive = False
         self._lastsqueries = dict()
         self._opened_files = dict()
-        self._file_id = None
-        self._opened_sheet = None
+        self._sheet_indexes = dict()
         self.get = partial(self.request, "GET")
         self.post = partial(self.request, "POST")
         self.put = partial(self.request, "PUT")
@@ -555,6 +2236,49 @@ class GoogleAPI(DebugRequests):
         self.head = partial(self.request, "HEAD")
         self._drive_name = None
         self._spreadsheets = None
+        self.sheet_cache = sheet_cache
+        self.incremental = incremental
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry
+        self.total_retries = 0
+        self._snapshots = dict()
+        self._prefetcher = None
+        if cache is True:
+            cache = MetadataCache()
+        elif cache is False:
+            cache = None
+        self.cache = cache
+        if rate_limit is True:
+            rate_limit = RateLimiter.default()
+        self.rate_limit = rate_limit
+        self._hooks = tuple()
+        if debug:
+            self.add_hook(LoggingSink())
+
+    def add_hook(self, hook):
+        """
+        Adds a hook called with a gapi.RequestEvent after each call, from the thread which made it.
+        :param hook: callable, like gapi.MetricsCollector or gapi.LoggingSink instances
+        :return: the given hook
+        """
+        with self._lock:
+            self._hooks = self._hooks + (hook,)
+        return hook
+
+    def remove_hook(self, hook):
+        with self._lock:
+            self._hooks = tuple([item for item in self._hooks if item is not hook])
+
+    @property
+    def body(self):
+        response = getattr(self._local, "response", None)
+        if response is not None:
+            return response.body
+
+    @body.setter
+    def body(self, value):
+        pass  # Responses are kept for each thread in GoogleAPI.response
 
     @property
     def drives(self):
@@ -571,10 +2295,39 @@ class GoogleAPI(DebugRequests):
 
     @property
     def spreadsheets(self):
-        if self._spreadsheets is None or self._spreadsheets.drive_name != self._drive_name:
-            self._spreadsheets = Files(self, self._drive_name, self._is_teamdrive,
-                                       _type="application/vnd.google-apps.spreadsheet")
-        return self._spreadsheets
+        with self._lock:
+            if self._spreadsheets is None or self._spreadsheets.drive_name != self._drive_name:
+                self._spreadsheets = Files(self, self._drive_name, self._is_teamdrive,
+                                           _type="application/vnd.google-apps.spreadsheet",
+                                           incremental=self.incremental or self.cache is not None)
+            return self._spreadsheets
+
+    @property
+    def response(self):
+        """
+        Gives the gapi.Response of the last request made by the current thread.
+        """
+        return getattr(self._local, "response", None)
+
+    @property
+    def status_code(self):
+        response = getattr(self._local, "response", None)
+        if response is not None:
+            return response.status_code
+
+    @status_code.setter
+    def status_code(self, value):
+        pass  # Responses are kept for each thread in GoogleAPI.response
+
+    @property
+    def text(self):
+        response = getattr(self._local, "response", None)
+        if response is not None:
+            return response.text
+
+    @text.setter
+    def text(self, value):
+        pass  # Responses are kept for each thread in GoogleAPI.response
 
     @property
     def teamdrives(self):
@@ -600,45 +2353,294 @@ class GoogleAPI(DebugRequests):
     def login(self, *, password=None):
         if password is None:
             password = " "
-        secret_data = json.loads(decode(password, self.secret_data))
-        self.oauth2(self.scopes, json_file=self.secret_file, secret_data=secret_data)
+        self._login(json.loads(decode(password, self.secret_data)))
+
+    def _login(self, secret):
+        """
+        Logs the connections of every thread in with the given decoded secret, or out if it is None.
+        """
+        with self._lock:
+            self._secret = secret
+            self._login_serial += 1
+        self._session()
+
+    def clone(self):
+        """
+        Gives a new GoogleAPI logged in with the same credentials, in the same drive and sharing the opened
+        spreadsheets.
+        :return: gapi.GoogleAPI instance
+        """
+        api = GoogleAPI(scopes=self.scopes, secret_file=self.secret_file, debug=self.debug,
+                        sheet_cache=self.sheet_cache, retry=self.retry, incremental=self.incremental,
+                        cache=self.cache, rate_limit=self.rate_limit)
+        api.secret_data = self.secret_data
+        api.session_class = self.session_class
+        api._teamdrives = self._teamdrives
+        api._drives = self._drives
+        api._drive_id = self._drive_id
+        api._drive_name = self._drive_name
+        api._is_teamdrive = self._is_teamdrive
+        api._opened_files = self._opened_files
+        api._sheet_indexes = self._sheet_indexes
+        api._hooks = self._hooks
+        with self._lock:
+            secret = self._secret
+        api._login(secret)
+        return api
 
     def logout(self):
-        self.oauth2_logout()
+        self._login(None)
 
     # REQUESTING
-    def request(self, method, url, *, data=None, json=None, headers=None, get=None):
+    def _session(self):
+        """
+        Gives the connection of the current thread, creating and logging it in if needed.
+        :return: gapi.DebugRequests instance
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            if threading.current_thread() is not threading.main_thread():
+                CoInitialize()
+            session = self.session_class(self.debug)
+            session.login_serial = None
+            session.logged_in = False
+            self._local.session = session
+        if session.login_serial != self._login_serial:
+            with self._lock:
+                secret, serial = self._secret, self._login_serial
+            if secret is not None:
+                session.oauth2(self.scopes, json_file=self.secret_file, secret_data=secret)
+                session.logged_in = True
+            elif session.logged_in is True:
+                session.oauth2_logout()
+                session.logged_in = False
+            session.login_serial = serial
+        return session
+
+    def _call(self, method, url, *, data=None, json=None, headers=None, get=None, retry=None, tokens=1):
+        """
+        Requests the given url through the connection of the current thread, retrying failed attempts as given by
+        the retry policy. Drive's 403 rate limit errors are retried as well.
+        :param retry: gapi.RetryPolicy for this call, or gapi.RetryCounter of a call in course. GoogleAPI.retry by
+                      default
+        :param tokens: requests charged to the quota by each attempt, as many as requests in a batch
+        :return: gapi.Response instance
+        :raises RetryError: if the attempts of the policy are exhausted
+        """
+        if retry is None:
+            retry = self.retry
+        if isinstance(retry, RetryPolicy):
+            retry = retry.begin()
+        initial = retry.retries
+        session = self._session()
+        limiter = self.rate_limit
+        if limiter is not None:
+            family = api_family(method, url)
+        hooks = self._hooks
+        if hooks:
+            start = time.monotonic()
+            response = failure = None
+        try:
+            while True:
+                if limiter is not None:
+                    limiter.acquire(family, tokens)
+                try:
+                    text = session.request(method, url, data=data, json=json, headers=headers, get=get)
+                except COMError as error:
+                    retry.backoff(error=error)
+                else:
+                    response = Response(session, text, retry.retries)
+                    self._local.response = response
+                    rate_limited = rate_limit_exceeded(response.status_code, response.text)
+                    if response.status_code not in retry.policy.statuses and rate_limited is False:
+                        return response
+                    retry_after = response.retry_after()
+                    if limiter is not None and (response.status_code == 429 or rate_limited is True):
+                        limiter.throttle(family, retry_after or retry.policy.delay(retry.retries + 1))
+                    retry.backoff(status_code=response.status_code, retry_after=retry_after)
+        except Exception as exception:
+            if hooks:
+                failure = exception
+            raise
+        finally:
+            self.retries = retry.retries
+            with self._lock:
+                self.total_retries += retry.retries - initial
+            if hooks:
+                self._emit(hooks, method, url, data, json, response, failure, time.monotonic() - start,
+                           retry.retries - initial)
+
+    def _emit(self, hooks, method, url, data, json_data, response, error, latency, retries):
+        """
+        Gives a gapi.RequestEvent of a call to the given hooks. Errors of the hooks are logged and ignored.
+        """
+        bytes_out = 0
+        if isinstance(data, str):
+            bytes_out = len(data.encode())
+        elif data is not None:
+            bytes_out = len(data)
+        elif json_data is not None:
+            bytes_out = len(json.dumps(json_data).encode())
+        status_code = bytes_in = None
+        if response is not None:
+            status_code = response.status_code
+            bytes_in = len(response.text.encode()) if isinstance(response.text, str) else len(response.text or b"")
+        event = RequestEvent(method, url, status_code=status_code, latency=latency, bytes_out=bytes_out,
+                             bytes_in=bytes_in or 0, retries=retries, error=error)
+        for hook in hooks:
+            try:
+                hook(event)
+            except Exception:
+                logging.getLogger("zashel.gapi").exception("Hook %r failed", hook)
+
+    def request(self, method, url, *, data=None, json=None, headers=None, get=None, retry=None):
+        """
+        Requests the given url, retrying failed attempts as given by the retry policy. The response is kept for the
+        current thread in GoogleAPI.response.
+        :param retry: gapi.RetryPolicy for this call, or gapi.RetryCounter of a call in course. GoogleAPI.retry by
+                      default
+        :return: text of the response
+        :raises RetryError: if the attempts of the policy are exhausted
+        """
+        return self._call(method, url, data=data, json=json, headers=headers, get=get, retry=retry).text
+
+    @contextmanager
+    def retrying(self, retry):
+        """
+        Context manager to make the calls inside it with the given retry policy. Only the calls of the current
+        thread are affected.
+        :param retry: gapi.RetryPolicy instance
+        """
+        previous = self._retrying
+        self._retrying = retry
+        try:
+            yield self
+        finally:
+            self._retrying = previous
+
+    @property
+    def retry(self):
+        """
+        Retry policy of the calls of the current thread: the one given to GoogleAPI.retrying, or the default one.
+        """
+        retry = self._retrying
+        if retry is None:
+            return self._retry
+        return retry
+
+    @retry.setter
+    def retry(self, retry):
+        self._retry = retry
+
+    def _request_json(self, method, url, *, retry=None, **kwargs):
+        """
+        Requests the given url and decodes the JSON response. Undecodable responses are retried under the same
+        retry policy as the request.
+        :return: decoded response
+        """
+        if retry is None:
+            retry = self.retry
+        if isinstance(retry, RetryPolicy):
+            retry = retry.begin()
         while True:
+            response = self._call(method, url, retry=retry, **kwargs)
             try:
-                dataX = DebugRequests.request(self, method, url, data=data, json=json, headers=headers, get=get) # Soberana CAGADA
-                if not int(self.status_code) in (500, 503, 504, 429, 408):
+                return json.loads(response.text)
+            except json.decoder.JSONDecodeError as error:
+                try:
+                    retry.backoff(status_code=response.status_code, error=error)
+                finally:
+                    self.retries = retry.retries
+                    with self._lock:
+                        self.total_retries += 1
+
+    # BATCHES
+    def drive_batch(self, requests, *, retry=None):
+        """
+        Makes Drive requests in batches of up to BATCHSIZE requests, each batch in a single round trip. Requests
+        failed with a retriable status, or over the rate limit, are sent again in a new batch, and only them. Each
+        request of a batch is charged to the rate limiter, as Drive charges it to the quota.
+        :param requests: list of dicts with "method", "url" and, optionally, "get" and "json" of each request
+        :param retry: gapi.RetryPolicy for the failed requests. GoogleAPI.retry by default
+        :return: list with a tuple of (status code, decoded body) for each request, in the same order. Requests
+                 still failing when the retries are exhausted are given with their last error
+        """
+        if retry is None:
+            retry = self.retry
+        counter = retry.begin()
+        results = [None] * len(requests)
+        pending = list(range(len(requests)))
+        while len(pending) > 0:
+            for init in range(0, len(pending), BATCHSIZE):
+                chunk = pending[init:init + BATCHSIZE]
+                boundary = "batch_{:x}".format(random.getrandbits(64))
+                response = self._call("POST", DRIVEBATCH, data=batch_encode([requests[index] for index in chunk],
+                                                                              boundary),
+                                      headers={"Content-Type": "multipart/mixed; boundary=" + boundary},
+                                      retry=retry, tokens=len(chunk))
+                if response.status_code != 200:
+                    for index in chunk:
+                        results[index] = (response.status_code, {"error": {"code": response.status_code,
+                                                                            "message": response.text}})
+                    continue
+                try:
+                    content_type = response.header("Content-Type") or str()
+                except HeadersNotAvailableError:  # The boundary is read from the body
+                    content_type = str()
+                boundary = re.search(r"boundary=\"?([^\";]+)", content_type)
+                replies = batch_decode(response.text, boundary and boundary.group(1) or None)
+                for position, index in enumerate(chunk):
+                    results[index] = replies.get(position, (500, {"error": {"code": 500,
+                                                                             "message": "Missing in batch"}}))
+            pending = [index for index in pending if self._batch_retriable(*results[index], retry)]
+            if len(pending) > 0:
+                status_code = max([results[index][0] for index in pending])
+                try:
+                    counter.backoff(status_code=status_code)
+                except RetryError:
                     break
-                else:
-                    time.sleep(1)
-            except COMError:
-                time.sleep(1)
-        return dataX
+                finally:
+                    with self._lock:
+                        self.total_retries += 1
+        return results
+
+    @staticmethod
+    def _batch_retriable(status_code, data, retry):
+        return status_code in retry.statuses or rate_limit_exceeded(status_code, data)
 
     # DRIVES
     def _list_drives(self):
         pass
 
     # TEAMDRIVES
-    def _teamdrives_list(self):
-        while True:
-            try:
-                self.get(TEAMDRIVES)
-                teamdrives = json.loads(self.text)
-            except json.decoder.JSONDecodeError:
-                time.sleep(1)
-                continue
-            else:
-                self._teamdrives = dict()
-                for item in teamdrives["teamDrives"]:
-                    self._teamdrives[item["name"]] = item["id"]
-                break
+    def _teamdrives_list(self, name=None):
+        """
+        Lists the teamdrives. If a name is given and the persistent cache knows it, the cached list is used.
+        :param name: name of the teamdrive needed
+        :return: None
+        """
+        if name is not None and self.cache is not None:
+            version, teamdrives = self.cache.get("teamdrives", "teamdrives")
+            if teamdrives is not None and name in teamdrives:
+                self._teamdrives = teamdrives
+                return
+        data = self._request_json("GET", TEAMDRIVES)
+        teamdrives = dict()
+        for item in data["teamDrives"]:
+            teamdrives[item["name"]] = item["id"]
+        self._teamdrives = teamdrives
+        if self.cache is not None:
+            self.cache.set("teamdrives", "teamdrives", teamdrives)
 
     def teamdrive_open(self, name):
+        """
+        Opens a teamdrive, in which files are listed and opened from then on. The opened drive is shared by every
+        thread: it must be chosen before sharing the client between threads, and threads working in other drives
+        need their own client, given by GoogleAPI.clone.
+        :param name: name of the teamdrive
+        :return: None
+        :raises TeamDriveNotFoundError: if there is no teamdrive with the given name
+        """
         teamdrives = self.teamdrives
         if name not in teamdrives:
             raise TeamDriveNotFoundError()
@@ -661,8 +2663,10 @@ class GoogleAPI(DebugRequests):
         files = self.files
         if origin in files and new_name not in files:
             file_id = self._files[origin]["id"]
-            self.post(COPYFILE.format(file_id), get={"supportsTeamDrives": self._is_teamdrive},
-                      json={"name": new_name})
+            data = self._request_json("POST", COPYFILE.format(file_id), get={"supportsTeamDrives": self._is_teamdrive},
+                                      json={"name": new_name})
+            if "id" in data:
+                files.add(data)
         elif new_name in files:
             pass # Nothing to do here.
         else:
@@ -685,32 +2689,350 @@ class GoogleAPI(DebugRequests):
         if where is None:
             where = self.files
         if name in where:
-            file_id = self._files[name]["id"]
-            self.port(FILEPERMISSIONS.format(file_id), get={"emailMessage": body,
-                                                             "sendNotificationEmail": send_email,
-                                                             "supportsTeamDrives": is_teamdrive},
-                      data = {"role": role,
-                              "type": perm_type,
-                              "emailAddress": email})
-
-    def file_download(self, name, where=None):
+            request = self._file_permission_request(where[name]["id"], email, perm_type=perm_type, role=role,
+                                                    send_email=send_email, body=body, is_teamdrive=is_teamdrive)
+            return self._request_json(request["method"], request["url"], get=request["get"], json=request["json"])
+
+    @staticmethod
+    def _file_permission_request(file_id, email, *, perm_type="user", role="writer", send_email=False, body=None,
+                                 is_teamdrive=True):
+        get = {"sendNotificationEmail": send_email and "true" or "false",
+               "supportsTeamDrives": is_teamdrive and "true" or "false"}
+        if body is not None:
+            get["emailMessage"] = body
+        return {"method": "POST",
+                "url": FILEPERMISSIONS.format(file_id),
+                "get": get,
+                "json": {"role": role, "type": perm_type, "emailAddress": email}}
+
+    def _files_get_modified_time(self, file_id):
+        data = self._request_json("GET", FILEDRIVE.format(file_id), get={"fields": "modifiedTime",
+                                                                          "supportsTeamDrives": self._is_teamdrive})
+        return data.get("modifiedTime")
+
+    def file_download(self, name, where=None, *, path=None, chunk_size=None, resume=False, workers=1,
+                      callback=None):
+        """
+        Downloads a file. By default it is got in a single response. Giving any of chunk_size, resume, workers or
+        callback it is streamed instead: requested in ranges of chunk_size bytes, each one written to the file as it
+        arrives, so memory used is bounded by chunk_size for each worker. If Drive does not honour ranges, the whole
+        file is got in the first request and no further ranges are requested.
+        :param name: name of the file
+        :param where: list of items to search name in. None by default
+        :param path: path to download the file to. Name of the file in the temporary folder by default
+        :param chunk_size: bytes of each range. CHUNKSIZE by default when streaming
+        :param resume: whether to continue an interrupted download of the same path or not
+        :param workers: number of ranges downloaded at the same time, into a file allocated beforehand
+        :param callback: function called with each chunk and its offset in the file. Ranges downloaded by several
+                         workers are not given in order
+        :return: path of the downloaded file
+        """
         if where is None:
             where = self.files
         if name in where:
             file_id = self._files[name]["id"]
-            self.get(FILEDRIVE.format(file_id), get={"supportsTeamDrives": self._is_teamdrive,
-                                                     "alt": "media"})
         else:
             raise FileNotFoundError()
-        tempfile = os.path.join(self.tempfolder.name, name)
+        if path is None:
+            path = os.path.join(self.tempfolder.name, name)
+        if chunk_size is None and resume is False and workers == 1 and callback is None:
+            return self._file_download_by_id(file_id, name, path)
+        if chunk_size is None:
+            chunk_size = CHUNKSIZE
+        size = self._file_get_size(file_id)
+        if workers > 1:
+            return self._file_download_parallel(file_id, path, size, chunk_size, resume, workers, callback)
+        offset = 0
+        if resume is True and os.path.exists(path):
+            offset = min(os.path.getsize(path), size)
+        with open(path, offset > 0 and "r+b" or "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            for chunk in self._file_iter_ranges(file_id, size, offset, chunk_size):
+                f.write(chunk)
+                if callback is not None:
+                    callback(chunk, offset)
+                offset += len(chunk)
+        return path
+
+    def _file_download_by_id(self, file_id, name, path=None):
+        self.get(FILEDRIVE.format(file_id), get={"supportsTeamDrives": self._is_teamdrive,
+                                                 "alt": "media"})
+        tempfile = path or os.path.join(self.tempfolder.name, name)
         with open(tempfile, "wb") as f:
             f.write(bytes(self.body))
         return tempfile
 
-    def files_list(self, *, drive_name=None, is_teamdrive=False):
-        if self._files is None or self._files.drive_name != drive_name:
-            self._files = Files(self, drive_name, is_teamdrive)
-        return self._files
+    def _file_download_parallel(self, file_id, path, size, chunk_size, resume, workers, callback):
+        parts = path + ".parts"
+        done = set()
+        if resume is True and os.path.exists(parts) and os.path.exists(path) and os.path.getsize(path) == size:
+            with open(parts) as f:
+                done = set(json.load(f))
+        else:
+            with open(path, "wb") as f:
+                f.truncate(size)
+        lock = threading.Lock()
+
+        def write(start, chunk):
+            with open(path, "r+b") as f:
+                f.seek(start)
+                f.write(chunk)
+            if callback is not None:
+                callback(chunk, start)
+
+        def download(index):
+            start = index * chunk_size
+            chunk, ranged = self._file_get_range(file_id, start, min(start + chunk_size, size) - 1)
+            if ranged is False:  # The whole file is written once
+                write(0, chunk)
+                return False
+            write(start, chunk)
+            with lock:
+                done.add(index)
+                with open(parts, "w") as f:
+                    json.dump(sorted(done), f)
+            return True
+
+        indexes = [index for index in range(ceil(size / chunk_size)) if index not in done]
+        if len(indexes) > 0 and download(indexes[0]) is True:  # The first range tells if ranges are honoured
+            with ThreadPoolExecutor(max_workers=workers, initializer=CoInitialize) as executor:
+                list(executor.map(download, indexes[1:]))
+        if os.path.exists(parts):
+            os.remove(parts)
+        return path
+
+    def _file_get_range(self, file_id, start, end):
+        """
+        Gets a range of bytes of a file.
+        :return: tuple of (content, whether the range was honoured or the whole file was given instead)
+        """
+        response = self._call("GET", FILEDRIVE.format(file_id), get={"supportsTeamDrives": self._is_teamdrive,
+                                                                     "alt": "media"},
+                              headers={"Range": f"bytes={start}-{end}"})
+        if response.status_code == 206:
+            return bytes(response.body), True
+        elif response.status_code == 200:  # Range not honoured, whole file given
+            return bytes(response.body), False
+        raise FileNotOpenError(response.text)
+
+    def _file_get_size(self, file_id):
+        data = self._request_json("GET", FILEDRIVE.format(file_id), get={"fields": "size",
+                                                                          "supportsTeamDrives": self._is_teamdrive})
+        return int(data.get("size", 0))
+
+    def _file_iter_ranges(self, file_id, size, offset, chunk_size):
+        while offset < size:
+            chunk, ranged = self._file_get_range(file_id, offset, min(offset + chunk_size, size) - 1)
+            if ranged is False:  # The rest of the whole file is given at once
+                yield chunk[offset:]
+                break
+            if len(chunk) == 0:
+                break
+            yield chunk
+            offset += len(chunk)
+
+    def file_iter_download(self, name, *, chunk_size=CHUNKSIZE, offset=0, where=None):
+        """
+        Downloads a file in ranges of chunk_size bytes, giving each one as it arrives.
+        :param name: name of the file
+        :param chunk_size: bytes of each range
+        :param offset: byte of the file to begin with, to resume an interrupted download
+        :param where: list of items to search name in. None by default
+        :return: generator of bytes
+        """
+        if where is None:
+            where = self.files
+        if name not in where:
+            raise FileNotFoundError()
+        file_id = self._files[name]["id"]
+        return self._file_iter_ranges(file_id, self._file_get_size(file_id), offset, chunk_size)
+
+    def _file_resumable_upload(self, method, url, metadata, source, name, chunk_size, mime_type):
+        if chunk_size <= 0 or chunk_size % (256 * 1024) != 0:
+            raise ValueError("chunk_size must be a multiple of 256 KiB")
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as f:
+                return self._file_resumable_upload(method, url, metadata, f, name, chunk_size, mime_type)
+        if hasattr(source, "read"):
+            source.seek(0, os.SEEK_END)
+            size = source.tell()
+
+            def read(start, end):
+                source.seek(start)
+                return source.read(end - start)
+        else:
+            source = memoryview(source).cast("B")
+            size = len(source)
+
+            def read(start, end):
+                return bytes(source[start:end])
+        if mime_type is None:
+            mime_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        get = {"uploadType": "resumable", "supportsTeamDrives": "true", "fields": FILEFIELDS}
+        response = self._call(method, url, get=get, json=metadata,
+                              headers={"X-Upload-Content-Type": mime_type, "X-Upload-Content-Length": str(size)})
+        session = response.header("Location")
+        if response.status_code != 200 or session is None:
+            raise FileNotOpenError(response.text)
+        once = RetryPolicy(attempts=1)
+        retry = self.retry.begin()
+        offset = 0
+        while True:
+            end = min(offset + chunk_size, size)
+            headers = {"Content-Range": f"bytes {offset}-{end - 1}/{size}"}
+            if size == 0:
+                headers = {"Content-Range": "bytes */0"}
+            try:
+                response = self._call("PUT", session, data=read(offset, end), headers=headers, retry=once)
+            except (RetryError, COMError):
+                retry.backoff()
+                response = self._call("PUT", session, headers={"Content-Range": f"bytes */{size}"})
+            if response.status_code in (200, 201):
+                return json.loads(response.text)
+            elif response.status_code == 308:
+                received = response.header("Range")
+                offset = received is not None and int(received.split("-")[-1]) + 1 or 0
+            elif response.status_code == 404:  # Upload session expired
+                raise FileNotOpenError(response.text)
+            else:
+                retry.backoff(status_code=response.status_code)
+
+    def file_update(self, name, source, *, chunk_size=UPLOADCHUNKSIZE, mime_type=None, where=None):
+        """
+        Replaces the content of a file with the resumable upload protocol, without loading it in memory.
+        :param name: name of the file to update
+        :param source: path, file object opened in binary mode, or buffer (bytes, memoryview, mmap...) of the content
+        :param chunk_size: bytes sent in each request, a multiple of 256 KiB
+        :param mime_type: mimeType of the content. Guessed by name by default
+        :param where: list of items to search name in. None by default
+        :return: dict with the metadata of the updated file
+        """
+        if where is None:
+            where = self.files
+        if name not in where:
+            raise FileNotFoundError()
+        file_id = where[name]["id"]
+        return self._file_resumable_upload("PATCH", UPLOADFILE.format(file_id), dict(), source, name, chunk_size,
+                                           mime_type)
+
+    def file_upload(self, source, name=None, *, parent=None, convert_to=None, chunk_size=UPLOADCHUNKSIZE,
+                    mime_type=None):
+        """
+        Uploads a new file with the resumable upload protocol, sending it in chunks without loading it in memory
+        and resuming from the offset reported by the server when a chunk fails.
+        :param source: path, file object opened in binary mode, or buffer (bytes, memoryview, mmap...) of the content
+        :param name: name of the new file. Name of the source path by default
+        :param parent: id of the folder of the new file. Root of the opened drive by default
+        :param convert_to: Google format to convert the file to: "spreadsheet", "document", "presentation",
+                           "drawing" or a mimeType
+        :param chunk_size: bytes sent in each request, a multiple of 256 KiB
+        :param mime_type: mimeType of the content. Guessed by name by default
+        :return: dict with the metadata of the new file
+        """
+        if name is None:
+            if not isinstance(source, (str, os.PathLike)):
+                raise ValueError("A name is needed to upload a file which is not given by path")
+            name = os.path.basename(source)
+        metadata = {"name": name}
+        if parent is None and self._is_teamdrive is True:
+            parent = self._drive_id
+        if parent is not None:
+            metadata["parents"] = [parent]
+        if convert_to is not None:
+            metadata["mimeType"] = GOOGLETYPES.get(convert_to, convert_to)
+        data = self._file_resumable_upload("POST", UPLOADDRIVE, metadata, source, name, chunk_size, mime_type)
+        if "id" in data:
+            self.files.add(data)
+        return data
+
+    def files_copy_many(self, pairs, *, where=None):
+        """
+        Copies files in batches of Drive requests.
+        :param pairs: list of tuples of (name of the file to copy, name of the copy)
+        :param where: list of items to search names in. None by default
+        :return: dict of {name of the copy: dict with the metadata of the copy, or with the error if it failed}
+        """
+        if where is None:
+            where = self.files
+        for origin, new_name in pairs:
+            if origin not in where:
+                raise FileNotFoundError(origin)
+        requests = [{"method": "POST",
+                     "url": COPYFILE.format(where[origin]["id"]),
+                     "get": {"supportsTeamDrives": "true", "fields": FILEFIELDS},
+                     "json": {"name": new_name}} for origin, new_name in pairs]
+        final = dict()
+        for (origin, new_name), (status_code, data) in zip(pairs, self.drive_batch(requests)):
+            if "id" in data:
+                self.files.add(data)
+            final[new_name] = data
+        return final
+
+    def files_get_many(self, file_ids, *, fields=FILEFIELDS):
+        """
+        Gets the metadata of several files in batches of Drive requests.
+        :param file_ids: list of ids of the files
+        :param fields: fields of the files to get
+        :return: dict of {id of the file: dict with the metadata, or with the error if it failed}
+        """
+        requests = [{"method": "GET",
+                     "url": FILEDRIVE.format(file_id),
+                     "get": {"supportsTeamDrives": "true", "fields": fields}} for file_id in file_ids]
+        return dict([(file_id, data) for file_id, (status_code, data) in zip(file_ids, self.drive_batch(requests))])
+
+    def files_grant_permissions(self, files, emails, role="writer", *, perm_type="user", send_email=False, body=None,
+                                where=None):
+        """
+        Grants each user a permission in each file, in batches of Drive requests.
+        :param files: list of names of the files
+        :param emails: list of emails of the users
+        :param role: role to grant, "writer" by default
+        :param perm_type: type of permission, "user" by default
+        :param send_email: whether to notify the users by email or not
+        :param body: message of the notification emails
+        :param where: list of items to search names in. None by default
+        :return: dict of {(name of file, email): dict with the permission, or with the error if it failed}
+        """
+        if where is None:
+            where = self.files
+        for name in files:
+            if name not in where:
+                raise FileNotFoundError(name)
+        keys = [(name, email) for name in files for email in emails]
+        requests = [self._file_permission_request(where[name]["id"], email, perm_type=perm_type, role=role,
+                                                  send_email=send_email, body=body)
+                    for name, email in keys]
+        return dict([(key, data) for key, (status_code, data) in zip(keys, self.drive_batch(requests))])
+
+    def files_list(self, *, drive_name=None, is_teamdrive=False, incremental=None, mime_type=None, parent=None,
+                   name=None, modified_after=None, fields=FILESFIELDS):
+        """
+        Gives the files of the given drive, listing them if the drive changes. Filtered listings are filtered by
+        Drive and are not kept as the files of the drive.
+        :param drive_name: name of the drive. Opened drive by default
+        :param is_teamdrive: whether the drive is a teamdrive or not
+        :param incremental: whether files are refreshed with the changes API. GoogleAPI.incremental by default
+        :param mime_type: mimeType of the files to list
+        :param parent: id of the folder of the files to list
+        :param name: exact name of the files to list
+        :param modified_after: list files modified after the given datetime.datetime or RFC 3339 string
+        :param fields: fields of the listing to get. None to get default fields
+        :return: gapi.Files instance
+        """
+        if incremental is None:
+            incremental = self.incremental or self.cache is not None
+        query = dict([(key, value) for key, value in (("mime_type", mime_type), ("parent", parent), ("name", name),
+                                                      ("modified_after", modified_after)) if value is not None])
+        if len(query) > 0:
+            return Files(self, drive_name, is_teamdrive, incremental=incremental, query=query, fields=fields)
+        with self._lock:
+            if self._files is None or self._files.drive_name != drive_name:
+                self._files = Files(self, drive_name, is_teamdrive, incremental=incremental, fields=fields)
+                if drive_name is not None:
+                    self._drive_id = self._files.drive_id
+                    self._is_teamdrive = self._files.is_teamdrive
+            return self._files
 
     def _files_open(self, path, returner, name, where=None, *, args=None, kwargs=None):
         if args is None:
@@ -720,20 +3042,22 @@ class GoogleAPI(DebugRequests):
         if where is None:
             where = self.files
         if name in where:
-            while True:
-                try:
-                    self._files_get_id_by_name(name)
-                    if self._file_id not in self._opened_files:
-                        self.get(path + "/" + str(self._file_id))
-                        if self.status_code == 200:
-                            self._opened_files[self._file_id] = json.loads(self.text)
-                        else:
-                            continue
-                except json.decoder.JSONDecodeError:
-                    time.sleep(1)
-                    continue
-                else:
-                    return returner(self, name, *args, **kwargs)
+            file_id = self._files_get_id_by_name(name)
+            if file_id not in self._opened_files:
+                modified_time = where[name].get("modifiedTime")
+                version, data = None, None
+                if self.cache is not None and modified_time is not None:
+                    version, data = self.cache.get("resource", file_id)
+                if data is None or version != modified_time:
+                    data = self._request_json("GET", path + "/" + str(file_id))
+                    if int(self.status_code) != 200:
+                        raise FileNotOpenError(data)
+                    if self.cache is not None and modified_time is not None:
+                        self.cache.set("resource", file_id, data, modified_time)
+                self._opened_files[file_id] = data
+                if path == SHEETS:
+                    self._spreadsheet_index(file_id)
+            return returner(self, name, *args, **kwargs)
         else:
             raise FileNotFoundError()
 
@@ -742,37 +3066,104 @@ class GoogleAPI(DebugRequests):
         data = {"function": function,
                 "parameters": parameters,
                 "devMode": dev_mode}
-        while True:
-            try:
-                self.post(SCRIPTS.format(script_id), json=data)
-                data = json.loads(self.text)
-            except json.decoder.JSONDecodeError:
-                time.sleep(1)
-                continue
-            else:
-                return data
+        return self._request_json("POST", SCRIPTS.format(script_id), json=data)
 
     # SPREADSHEETS
+    def _spreadsheet_invalidate_snapshots(self, file_id):
+        for key in list(self._snapshots.keys()):
+            if key[0] == file_id:
+                self._snapshots.pop(key, None)
+
+    def _spreadsheet_apply_batch_update(self, file_id, requests, data):
+        with self._lock:
+            return self._spreadsheet_apply_replies(file_id, requests, data)
+
+    def _spreadsheet_apply_replies(self, file_id, requests, data):
+        if "updatedSpreadsheet" in data:
+            self._opened_files[file_id].update(data["updatedSpreadsheet"])
+            return self._spreadsheet_index(file_id)
+        self._spreadsheet_get_index(file_id)  # Loads the spreadsheet if it is not loaded yet
+        sheets = self._opened_files[file_id].setdefault("sheets", list())
+        for request, reply in zip(requests, data.get("replies", list())):
+            if "addSheet" in reply:
+                properties = reply["addSheet"]["properties"]
+                for sheet in sheets:
+                    if sheet["properties"].get("index", 0) >= properties.get("index", len(sheets)):
+                        sheet["properties"]["index"] = sheet["properties"].get("index", 0) + 1
+                sheets.append({"properties": properties})
+            elif "deleteSheet" in request:
+                sheet_id = request["deleteSheet"]["sheetId"]
+                deleted = [sheet["properties"].get("index", 0) for sheet in sheets
+                           if sheet["properties"]["sheetId"] == sheet_id]
+                sheets[:] = [sheet for sheet in sheets if sheet["properties"]["sheetId"] != sheet_id]
+                for sheet in sheets:
+                    if len(deleted) > 0 and sheet["properties"].get("index", 0) > deleted[0]:
+                        sheet["properties"]["index"] -= 1
+            elif "updateSheetProperties" in request:
+                properties = request["updateSheetProperties"]["properties"]
+                for sheet in sheets:
+                    if sheet["properties"]["sheetId"] == properties.get("sheetId", 0):
+                        sheet["properties"].update(properties)
+        return self._spreadsheet_index(file_id)
+
+    def _spreadsheet_get_index(self, file_id):
+        if file_id not in self._sheet_indexes:
+            if file_id in self._opened_files and "sheets" in self._opened_files[file_id]:
+                return self._spreadsheet_index(file_id)
+            self._spreadsheet_load(file_id)
+        return self._sheet_indexes[file_id]
+
+    def _spreadsheet_grow_index(self, file_id, updated_range):
+        updated_range = A1Range.parse(updated_range)
+        sheet_name = updated_range.sheet
+        if updated_range.end_row is None:
+            return
+        rows = updated_range.end_row + 1
+        with self._lock:
+            index = self._sheet_indexes.get(file_id, dict())
+            if sheet_name in index and index[sheet_name]["rowCount"] < rows:
+                index[sheet_name]["rowCount"] = rows
+                for sheet in self._opened_files[file_id]["sheets"]:
+                    if sheet["properties"]["title"] == sheet_name:
+                        sheet["properties"]["gridProperties"]["rowCount"] = rows
+
+    def _spreadsheet_index(self, file_id):
+        index = dict()
+        for sheet in self._opened_files[file_id].get("sheets", list()):
+            properties = sheet["properties"]
+            grid = properties.get("gridProperties", dict())
+            index[properties["title"]] = {"sheetId": properties["sheetId"],
+                                          "index": properties.get("index", 0),
+                                          "rowCount": grid.get("rowCount", 0),
+                                          "columnCount": grid.get("columnCount", 0)}
+        self._sheet_indexes[file_id] = index
+        return index
+
+    def _spreadsheet_load(self, file_id):
+        data = self._request_json("GET", SHEETS + "/" + str(file_id))
+        if int(self.status_code) != 200:
+            raise FileNotOpenError(data)
+        self._opened_files[file_id] = data
+        return self._spreadsheet_index(file_id)
+
+    def _spreadsheet_snapshot_is_current(self, snapshot, file_id):
+        now = datetime.datetime.now()
+        if snapshot.checked + datetime.timedelta(seconds=SNAPSHOTCHECK) > now:
+            return True
+        snapshot.checked = now
+        return self._files_get_modified_time(file_id) == snapshot.modified_time
+
     def spreadsheet_add_sheet(self, sheetname, *, name=None, rows=1, columns=3):
-        self._files_get_id_by_name(name)
-        if self._file_id is not None:
-            data = {"includeSpreadsheetInResponse": "true",
-                    "requests": [{"addSheet": {"properties": {"title": sheetname,
-                                                              "gridProperties": {"rowCount": rows,
-                                                                                 "columnCount": columns}}}},
-                                 ]
-                    }
-            while True:
-                try:
-                    self.post(SHEET_BATCHUPDATE.format(self._file_id), json=data)
-                    data = json.loads(self.text)
-                except json.decoder.JSONDecodeError:
-                    time.sleep(1)
-                    continue
-                else:
-                    if "updatedSpreadsheet" in data:
-                        self._opened_files[self._file_id].update(data["updatedSpreadsheet"])
-                    break
+        file_id = self._files_get_id_by_name(name)
+        if file_id is not None:
+            requests = [{"addSheet": {"properties": {"title": sheetname,
+                                                     "gridProperties": {"rowCount": rows,
+                                                                        "columnCount": columns}}}},
+                        ]
+            data = {"requests": requests}
+            self._spreadsheet_invalidate_snapshots(file_id)
+            data = self._request_json("POST", SHEET_BATCHUPDATE.format(file_id), json=data)
+            self._spreadsheet_apply_batch_update(file_id, requests, data)
             return self.spreadsheet_open_sheet(sheetname, name=name)
         else:
             raise FileNotOpenError()
@@ -795,125 +3186,276 @@ class GoogleAPI(DebugRequests):
                             updated
         :return: The updated range in "A1" notation
         """
-        self._files_get_id_by_name(name)
+        file_id = self._files_get_id_by_name(name)
         _range = self.spreadsheet_check_range(_range, name=name)
-        if self._file_id is not None:
-            while True:
-                try:
-                    self.post(SHEET_APPEND.format(self._file_id, _range), get={"valueInputOption": input_option,
-                                                                               "insertDataOption": insert_data,
-                                                                               "includeValuesInResponse": "true"},
-                              json={"range": _range, "values": values})
-                    data = json.loads(self.text)
-                except json.decoder.JSONDecodeError:
-                    time.sleep(1)
-                    continue
-                else:
-                    with open("data.json", "w") as f:
-                        f.write(json.dumps(data))
-                    if "updates" in data:
-                        updated_range = data["updates"]["updatedRange"]
-                        return updated_range
-                    else:
-                        return data
+        if file_id is not None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+            data = self._request_json("POST", SHEET_APPEND.format(file_id, _range),
+                                      get={"valueInputOption": input_option,
+                                           "insertDataOption": insert_data,
+                                           "includeValuesInResponse": "true"},
+                                      json={"range": _range, "values": values})
+            if "updates" in data:
+                updated_range = data["updates"]["updatedRange"]
+                self._spreadsheet_grow_index(file_id, updated_range)
+                return updated_range
+            else:
+                return data
         else:
             raise FileNotOpenError()
 
     def spreadsheet_clear_range(self, range, *, name=None):
-        self._files_get_id_by_name(name)
+        file_id = self._files_get_id_by_name(name)
         range = self.spreadsheet_check_range(range, name=name)
-        if self._file_id is not None:
-            self.post(SHEET_CLEAR.format(self._file_id, range))
+        if file_id is not None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+            self.post(SHEET_CLEAR.format(file_id, range))
         else:
             raise FileNotOpenError()
 
     def spreadsheet_delete_sheet(self, sheetname, *, name=None):
-        self._files_get_id_by_name(name)
-        if self._file_id is not None:
-            file_data = self._opened_files[self._file_id]["sheets"]
-            sheet_ids = dict([(item["properties"]["title"], item["properties"]["sheetId"]) for item in file_data])
-            if sheetname in sheet_ids:
-                sheet_id = sheet_ids[sheetname]
-                data = {"includeSpreadsheetInResponse": "true",
-                        "requests": [{"deleteSheet": {"sheetId": sheet_id}},
-                                     ]
-                        }
-                while True:
-                    try:
-                        self.post(SHEET_BATCHUPDATE.format(self._file_id), json=data)
-                        data = json.loads(self.text)
-                    except json.decoder.JSONDecodeError:
-                        time.sleep(1)
-                        continue
-                    else:
-                        if "updatedSpreadsheet" in data:
-                            self._opened_files[self._file_id].update(data["updatedSpreadsheet"])
-                        break
+        file_id = self._files_get_id_by_name(name)
+        if file_id is not None:
+            index = self._spreadsheet_get_index(file_id)
+            if sheetname in index:
+                sheet_id = index[sheetname]["sheetId"]
+                requests = [{"deleteSheet": {"sheetId": sheet_id}},
+                            ]
+                data = {"requests": requests}
+                self._spreadsheet_invalidate_snapshots(file_id)
+                data = self._request_json("POST", SHEET_BATCHUPDATE.format(file_id), json=data)
+                self._spreadsheet_apply_batch_update(file_id, requests, data)
             else:
                 raise SheetNotFoundError()
         else:
             raise FileNotOpenError()
 
+    def spreadsheet_batch_clear(self, ranges, *, name=None):
+        """
+        Clears several ranges in a single request.
+        :param ranges: list of ranges in "A1" notation
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :return: list of cleared ranges in "A1" notation
+        """
+        file_id = self._files_get_id_by_name(name)
+        ranges = [self.spreadsheet_check_range(_range, name=name) for _range in ranges]
+        if file_id is not None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+            data = self._request_json("POST", SHEET_BATCHCLEAR.format(file_id), json={"ranges": ranges})
+            return data.get("clearedRanges", list())
+        else:
+            raise FileNotOpenError()
+
+    def spreadsheet_batch_update(self, requests, *, name=None):
+        """
+        Sends requests of spreadsheets.batchUpdate in a single call, updating the opened spreadsheet from the
+        spreadsheet given in the response.
+        :param requests: list of Request dicts of the Sheets API
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :return: list of replies of the requests
+        """
+        file_id = self._files_get_id_by_name(name)
+        if file_id is not None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+            data = self._request_json("POST", SHEET_BATCHUPDATE.format(file_id),
+                                      json={"requests": requests,
+                                            "includeSpreadsheetInResponse": True,
+                                            "responseIncludeGridData": False})
+            if "error" in data:
+                raise SheetError(data["error"])
+            self._spreadsheet_apply_batch_update(file_id, requests, data)
+            return data.get("replies", list())
+        else:
+            raise FileNotOpenError()
+
+    def spreadsheet_batch_update_values(self, data, *, name=None, input_option="USER_ENTERED", include_values=False,
+                                        render="FORMATTED_VALUE"):
+        """
+        Updates the values of several ranges in a single request.
+        :param data: list of (range in "A1" notation, list of lists of values), or dict of {range: values}
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :param input_option: how data may be processed, "USER_ENTERED" by default, "RAW" to be given if data may be
+                            included as is
+        :param include_values: whether to get the values the ranges take, formulas calculated, instead of the ranges
+        :param render: how the values got are rendered: "FORMATTED_VALUE", "UNFORMATTED_VALUE" or "FORMULA"
+        :return: list of updated ranges in "A1" notation, or list with the list of lists of values of each range if
+                 include_values is True
+        """
+        file_id = self._files_get_id_by_name(name)
+        if isinstance(data, dict):
+            data = list(data.items())
+        data = [{"range": self.spreadsheet_check_range(_range, name=name), "values": values}
+                for _range, values in data]
+        if file_id is not None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+            body = {"valueInputOption": input_option, "data": data}
+            if include_values is True:
+                body.update({"includeValuesInResponse": True, "responseValueRenderOption": render})
+            response = self._request_json("POST", SHEET_BATCHUPDATEVALUES.format(file_id), json=body)
+            if include_values is True:
+                return [self._spreadsheet_poll_values(item["updatedData"].get("range"),
+                                                      item["updatedData"].get("values", [[]]), name=name,
+                                                      render=render)
+                        if "updatedData" in item else [[]] for item in response.get("responses", list())]
+            return [item["updatedRange"] for item in response.get("responses", list()) if "updatedRange" in item]
+        else:
+            raise FileNotOpenError()
+
     def spreadsheet_check_range(self, range, *, name=None, autoopen=True):
         final = range
-        if "!" in range:
-            sheet, range = range.split("!")
+        parsed = A1Range.parse(range)
+        if parsed.sheet is not None:
             if not self._opened_sheet or autoopen is True:
-                self.spreadsheet_open_sheet(sheet)
-            elif self._opened_sheet != sheet and autoopen is False:
+                self.spreadsheet_open_sheet(parsed.sheet)
+            elif self._opened_sheet != parsed.sheet and autoopen is False:
                 raise SheetError()
         elif self._opened_sheet:
-            final = "!".join((self._opened_sheet, range))
+            parsed.sheet = self._opened_sheet
+            final = str(parsed)
+        return final
+
+    def spreadsheet_find_rows(self, sheet_name, conditions, *, name=None):
+        """
+        Finds the rows of a sheet tagged with the given values of their columns by SpreadsheetBatch.tag_rows, in a
+        single request which gets the first row too, to leave out rows whose values changed after being tagged.
+        :param sheet_name: title of the sheet
+        :param conditions: dict of {name of column: value}
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :return: list of (index of row, list of values) matching every condition, in the order of the sheet
+        """
+        file_id = self._files_get_id_by_name(name)
+        if file_id is None:
+            raise FileNotOpenError()
+        index = self._spreadsheet_get_index(file_id)
+        if sheet_name not in index:
+            raise SheetNotFoundError(sheet_name)
+        sheet_id = index[sheet_name]["sheetId"]
+        keys = set([ROWTAG.format(column) for column in conditions])
+        filters = [{"a1Range": str(A1Range(sheet_name, 0, None, 0, None))}]
+        filters.extend([row_filter(sheet_id, column, value) for column, value in conditions.items()])
+        header = list()
+        matches = dict()
+        for _range, values, data_filters in self.spreadsheet_get_by_data_filter(filters, name=name):
+            if any(["a1Range" in item for item in data_filters]):
+                header = values[0]
+            matched = set([item["developerMetadataLookup"]["metadataKey"] for item in data_filters
+                           if "developerMetadataLookup" in item])
+            if len(matched) == 0:
+                continue
+            start = A1Range.parse(_range).start_row
+            for offset, row in enumerate(values):
+                matches.setdefault(start + offset, (row, set()))[1].update(matched)
+        final = list()
+        for row_index in sorted(matches.keys()):
+            row, matched = matches[row_index]
+            if matched != keys:
+                continue
+            current = True
+            for column, value in conditions.items():
+                if column in header:
+                    position = header.index(column)
+                    if cell_text(row[position] if position < len(row) else "") != cell_text(value):
+                        current = False
+            if current is True:
+                final.append((row_index, row))
         return final
 
+    def spreadsheet_get_by_data_filter(self, filters, *, name=None, render="FORMATTED_VALUE"):
+        """
+        Gets the values of the ranges matching several DataFilters, like "a1Range" or "developerMetadataLookup", in a
+        single request.
+        :param filters: list of DataFilter dicts of the Sheets API
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :param render: how the values are rendered: "FORMATTED_VALUE", "UNFORMATTED_VALUE" or "FORMULA"
+        :return: list of (range in "A1" notation, list of lists of values, list of DataFilters matching it) for each
+                 range matched
+        """
+        file_id = self._files_get_id_by_name(name)
+        if file_id is None:
+            raise FileNotOpenError()
+        if len(filters) == 0:
+            return list()
+        data = self._request_json("POST", SHEET_BATCHGETBYDATAFILTER.format(file_id),
+                                  json={"dataFilters": filters, "majorDimension": "ROWS", "valueRenderOption": render})
+        return [(item["valueRange"].get("range"), item["valueRange"].get("values", [[]]),
+                 item.get("dataFilters", list())) for item in data.get("matchedValueRanges", list())]
+
+    def spreadsheet_get_columns(self, sheet_name=None, *, name=None):
+        """
+        Gets the values of a sheet by columns, unformatted and with dates as serial numbers, in a single request.
+        :param sheet_name: title of the sheet. Opened sheet by default
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :return: list with a list of values for each column, padded with None to the last used row
+        """
+        if sheet_name is None:
+            sheet_name = self._opened_sheet
+        cols, rows = self.spreadsheet_get_sheet_dimensions(sheet_name, name=name)
+        file_id = self._file_id
+        if file_id is None:
+            raise FileNotOpenError()
+        range = str(A1Range.rows_of(sheet_name, 0, rows - 1, cols))
+        data = self._request_json("GET", SHEET_VALUES.format(file_id, range),
+                                  get={"majorDimension": "COLUMNS",
+                                       "valueRenderOption": "UNFORMATTED_VALUE",
+                                       "dateTimeRenderOption": "SERIAL_NUMBER"})
+        columns = data.get("values", list())
+        height = max([len(column) for column in columns] + [0])
+        for column in columns:
+            column.extend([None] * (height - len(column)))
+        return columns
+
     def spreadsheet_get_sheet_dimensions(self, sheet_name=None, *, name=None, autoopen=True):
-        self._files_get_id_by_name(name)
-        self.spreadsheet_open(name=name)
+        file_id = self._files_get_id_by_name(name)
         if not self._opened_sheet or autoopen is True:
             self.spreadsheet_open_sheet(sheet_name)
         elif self._opened_sheet != sheet_name and autoopen is False:
             raise SheetError()
-        sheets = self._opened_files[self._file_id]["sheets"]
-        for sheet in sheets:
-            if sheet["properties"]["title"] == sheet_name:
-                grid = sheet["properties"]["gridProperties"]
-                return (grid["columnCount"], grid["rowCount"])
+        index = self._spreadsheet_get_index(file_id)
+        if sheet_name in index:
+            return (index[sheet_name]["columnCount"], index[sheet_name]["rowCount"])
         raise SheetNotFoundError
 
     def spreadsheet_get_sheet_values(self, sheet_name=None, *, name=None, autoopen=True):
         cols, rows = self.spreadsheet_get_sheet_dimensions(sheet_name, name=name, autoopen=autoopen)
-        return self.spreadsheet_get_range(sheet_name+"!A1:"+self.spreadsheet_get_range_name(cols, rows))
+        return self.spreadsheet_get_range(str(A1Range.rows_of(sheet_name, 0, rows - 1, cols)))
+
+    def spreadsheet_get_snapshot(self, sheet_name=None, *, name=None, ttl=None):
+        """
+        Gives the snapshot of the values of the given sheet, loading it if it is not cached or it is no longer
+        valid. Snapshots are invalidated by writes made with this instance, by their ttl and by a change in the
+        modifiedTime of the file, checked at most every SNAPSHOTCHECK seconds.
+        :param sheet_name: title of the sheet
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :param ttl: seconds the snapshot is valid for. None to keep it until it is invalidated
+        :return: gapi.SheetSnapshot instance
+        """
+        file_id = self._files_get_id_by_name(name)
+        key = (file_id, sheet_name)
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.expired is False and \
+                self._spreadsheet_snapshot_is_current(snapshot, file_id) is True:
+            return snapshot
+        modified_time = self._files_get_modified_time(file_id)
+        cols, rows = self.spreadsheet_get_sheet_dimensions(sheet_name, name=name)
+        values = self.spreadsheet_get_range(str(A1Range.rows_of(sheet_name, 0, rows - 1, cols)), name=name)
+        if values == [[]]:
+            values = list()
+        snapshot = SheetSnapshot(values, (cols, rows), modified_time, ttl)
+        self._snapshots[key] = snapshot
+        return snapshot
 
     def spreadsheet_get_range_name(self, column, row, **kwargs):
-        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-        subcolumn = column - 1
-        final = str()
-        while subcolumn >= len(letters):
-            final = letters[subcolumn%len(letters)]+final
-            subcolumn = floor(subcolumn/len(letters)) - 1
-        final = letters[subcolumn] + final
-        return final + str(row)
+        return column_letters(column - 1) + str(row)
 
     def spreadsheet_get_range_by_name(self, range, **kwargs):
-        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-        column_name, row, void = re.split(r"([0-9]+)", range)
-        column = int()
-        for index, letter in enumerate(column_name):
-            column += len(column_name) * (letters.index(letter) + 1)
-        return column, int(row)
+        parsed = A1Range.parse(range)
+        return parsed.start_column + 1, parsed.start_row + 1
 
     def spreadsheet_get_range(self, range, *, name=None):
-        self._files_get_id_by_name(name)
+        file_id = self._files_get_id_by_name(name)
         range = self.spreadsheet_check_range(range, name=name)
-        if self._file_id is not None:
-            while True:
-                try:
-                    data = json.loads(self.get(SHEET_VALUES.format(self._file_id, range)))
-                except json.decoder.JSONDecodeError:
-                    time.sleep(1)
-                    continue
-                else:
-                    break
+        if file_id is not None:
+            data = self._request_json("GET", SHEET_VALUES.format(file_id, range))
             if "values" in data:
                 return data["values"]
             else:
@@ -921,19 +3463,118 @@ class GoogleAPI(DebugRequests):
         else:
             raise FileNotOpenError()
 
+    def spreadsheet_get_ranges(self, ranges, *, name=None):
+        """
+        Gets the values of several ranges in a single request.
+        :param ranges: list of ranges in "A1" notation. A dict of {name of spreadsheet: list of ranges} gets the
+                       ranges of several spreadsheets, with a request for each spreadsheet
+        :param name: name of the spreadsheet. Opened spreadsheet by default. Ignored if ranges is a dict
+        :return: list with a list of lists of values for each range, in the same order as ranges. A dict of
+                 {name of spreadsheet: list of values} if ranges is a dict
+        """
+        if isinstance(ranges, dict):
+            return dict([(spreadsheet, self.spreadsheet_get_ranges(ranges[spreadsheet], name=spreadsheet))
+                         for spreadsheet in ranges])
+        file_id = self._files_get_id_by_name(name)
+        ranges = [self.spreadsheet_check_range(_range, name=name) for _range in ranges]
+        if len(ranges) == 0:
+            return list()
+        if file_id is not None:
+            query = urlencode([("ranges", _range) for _range in ranges], quote_via=quote)
+            data = self._request_json("GET", SHEET_BATCHGET.format(file_id) + "?" + query)
+            final = list()
+            for value_range in data.get("valueRanges", list()):
+                if "values" in value_range:
+                    final.append(value_range["values"])
+                else:
+                    final.append([[]])
+            return final
+        else:
+            raise FileNotOpenError()
+
     def spreadsheet_get_total_cells(self, *, name=None):
-        self._files_get_id_by_name(name)
-        while True:
-            try:
-                sheets = self._opened_files[self._file_id]["sheets"]
-            except KeyError:
-                time.sleep(1) # Take a break
-                pass
-            else:
-                time.sleep(0.5)
-                break
-        return sum([sheet["properties"]["gridProperties"]["columnCount"]*sheet["properties"]["gridProperties"]["rowCount"]
-                    for sheet in sheets])
+        file_id = self._files_get_id_by_name(name)
+        index = self._spreadsheet_get_index(file_id)
+        return sum([sheet["columnCount"]*sheet["rowCount"] for sheet in index.values()])
+
+    def spreadsheet_invalidate_snapshot(self, sheet_name=None, *, name=None):
+        """
+        Discards the snapshot of the given sheet, or of every sheet of the spreadsheet if no sheet is given.
+        :param sheet_name: title of the sheet. All sheets by default
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :return: None
+        """
+        file_id = self._files_get_id_by_name(name)
+        if sheet_name is None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+        else:
+            self._snapshots.pop((file_id, sheet_name), None)
+
+    def _prefetch_executor(self):
+        with self._lock:
+            if self._prefetcher is None:
+                self._prefetcher = ThreadPoolExecutor(max_workers=1, initializer=CoInitialize)
+            return self._prefetcher
+
+    def close(self):
+        """
+        Waits for the background requests in course and stops the worker making them. A new one is started if they
+        are needed again.
+        """
+        with self._lock:
+            prefetcher, self._prefetcher = self._prefetcher, None
+        if prefetcher is not None:
+            prefetcher.shutdown(wait=True)
+
+    def spreadsheet_iter_rows(self, sheet_name=None, *, name=None, page_size=PAGESIZE, prefetch=True):
+        """
+        Iterates the values of a sheet getting them in windows of page_size rows, up to the last row of its grid.
+        Empty rows are only given when a row with values follows them, so the iteration ends at the last used row.
+        Windows are prefetched by a single worker of the instance, kept for later iterations and stopped by
+        GoogleAPI.close.
+        :param sheet_name: title of the sheet. Opened sheet by default
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :param page_size: rows got in each request
+        :param prefetch: whether to get the next window in a background thread while the current one is iterated
+        :return: generator of lists of values, one for each row
+        """
+        if sheet_name is None:
+            sheet_name = self._opened_sheet
+        cols, rows = self.spreadsheet_get_sheet_dimensions(sheet_name, name=name)
+        file_id = self._file_id
+        if file_id is None:
+            raise FileNotOpenError()
+        def get_window(init):
+            end = min(init + page_size, rows)
+            range = str(A1Range.rows_of(sheet_name, init, end - 1, cols))
+            return self._request_json("GET", SHEET_VALUES.format(file_id, range)).get("values", list())
+
+        executor = None
+        if prefetch is True:
+            executor = self._prefetch_executor()
+        following = None
+        try:
+            pending = 0  # Empty rows not given yet, as they are only given if a row with values follows them
+            for init in range(0, rows, page_size):
+                if following is not None:
+                    window = following.result()
+                else:
+                    window = get_window(init)
+                following = None
+                if executor is not None and init + page_size < rows:
+                    following = executor.submit(get_window, init + page_size)
+                for values in window:
+                    if len(values) == 0:
+                        pending += 1
+                        continue
+                    for empty in range(pending):
+                        yield list()
+                    pending = 0
+                    yield values
+                pending += min(page_size, rows - init) - len(window)
+        finally:
+            if following is not None and following.cancel() is False:
+                wait([following])
 
     def spreadsheet_open(self, name=None, **kwargs):
         if name is None and "name" in kwargs:
@@ -943,48 +3584,67 @@ class GoogleAPI(DebugRequests):
         return self._files_open(SHEETS, Spreadsheets, name, self.spreadsheets)
 
     def spreadsheet_open_sheet(self, sheet_name, *, name=None, just_open=False):
-        self._files_get_id_by_name(name)
-        while True:
-            try:
-                sheets = self._opened_files[self._file_id]["sheets"]
-            except KeyError:
-                if self._file_id in self._opened_files:
-                    del(self._opened_files[self._file_id])
-                    just_open = True
-                self.spreadsheet_open(name)
-                self._files_get_id_by_name(name)
-                time.sleep(1)
-                pass
-            else:
-                time.sleep(1)
-                break
-        for sheet in sheets:
-            if sheet["properties"]["title"] == sheet_name:
-                self._opened_sheet = sheet_name
-                return
+        """
+        Sets the given sheet as the opened one. Known sheets are opened without requesting anything, unknown ones
+        get the spreadsheet again once in case the sheet was created elsewhere.
+        :param sheet_name: title of the sheet
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :param just_open: whether the spreadsheet has just been got or not
+        :return: None
+        """
+        file_id = self._files_get_id_by_name(name)
+        if sheet_name in self._spreadsheet_get_index(file_id):
+            self._opened_sheet = sheet_name
+            return
         if just_open is False:
-            if self._file_id in self._opened_files:
-                del(self._opened_files[self._file_id])
-            self.spreadsheet_open(name)
+            self._spreadsheet_load(file_id)
             return self.spreadsheet_open_sheet(sheet_name, name=name, just_open=True)
         raise SheetNotFoundError(sheet_name)
 
-    def spreadsheet_update_range(self, range, values, *, name=None):
-        self._files_get_id_by_name(name)
+    def _spreadsheet_poll_values(self, range, values, *, name=None, render="FORMATTED_VALUE"):
+        """
+        Reads again the values of a range while any of its cells is still being calculated, waiting with
+        exponential backoff between reads, up to POLLATTEMPTS reads.
+        :return: last values read
+        """
+        counter = RetryPolicy(attempts=POLLATTEMPTS, base=0.5, max_delay=8).begin()
+        while any([value in LOADINGVALUES for row in values for value in row]):
+            try:
+                counter.backoff()
+            except RetryError:
+                break
+            file_id = self._files_get_id_by_name(name)
+            data = self._request_json("GET", SHEET_VALUES.format(file_id, range),
+                                      get={"valueRenderOption": render})
+            values = data.get("values", [[]])
+        return values
+
+    def spreadsheet_update_range(self, range, values, *, name=None, include_values=None, render="FORMATTED_VALUE"):
+        """
+        Updates the values of a range. The values the range takes, formulas calculated, may be given in the same
+        response, and cells still being calculated are read again until they are done, for a bounded time.
+        :param range: range in "A1" notation
+        :param values: list of lists of values
+        :param name: name of the spreadsheet. Opened spreadsheet by default
+        :param include_values: whether to get the values the range takes. By default, only if there are formulas
+        :param render: how the values got are rendered: "FORMATTED_VALUE", "UNFORMATTED_VALUE" or "FORMULA"
+        :return: list of lists of values the range takes, [[]] if they are not got
+        """
+        file_id = self._files_get_id_by_name(name)
         range = self.spreadsheet_check_range(range, name=name)
-        if self._file_id is not None:
-            while True:
-                try:
-                    data = json.loads(self.put(SHEET_VALUES.format(self._file_id, range),
-                                               get={"valueInputOption": "USER_ENTERED"},
-                                               json={"range": range, "values": values}))
-                except json.decoder.JSONDecodeError:
-                    time.sleep(1)
-                    continue
-                else:
-                    break
-            if "values" in data:
-                return data["values"]
+        if include_values is None:
+            include_values = any([Spreadsheets.Sheet.Row._is_formula(value) for row in values for value in row])
+        if file_id is not None:
+            self._spreadsheet_invalidate_snapshots(file_id)
+            get = {"valueInputOption": "USER_ENTERED"}
+            if include_values is True:
+                get.update({"includeValuesInResponse": "true", "responseValueRenderOption": render})
+            data = self._request_json("PUT", SHEET_VALUES.format(file_id, range), get=get,
+                                      json={"range": range, "values": values})
+            if "updatedData" in data:
+                return self._spreadsheet_poll_values(data["updatedData"].get("range", range),
+                                                     data["updatedData"].get("values", [[]]), name=name,
+                                                     render=render)
             else:
                 return [[]]
         else:
@@ -992,10 +3652,15 @@ class GoogleAPI(DebugRequests):
 
 
 class SheetList(list):
+    """
+    List of the distinct rows of a sheet, or of its values if every row has a single one. Items appended are
+    appended to the sheet if they are not in the list yet, which is checked in constant time against an index of
+    the rows by the text their values are shown with.
+    """
     def __init__(self, sheet):
         assert isinstance(sheet, Spreadsheets.Sheet)
         data = sheet.get_sheet_values()
-        if data[-1] == []:
+        if len(data) > 0 and data[-1] == []:
             del(data[-1])
         if all([len(item)==1 for item in data]):
             data = [item[0] for item in data]
@@ -1005,23 +3670,207 @@ class SheetList(list):
         super().__init__(data)
         self.sheet = sheet
         self.cutted = cutted
+        self._index = set([self._key(item) for item in data])
+
+    def __contains__(self, item):
+        return self._key(item) in self._index
+
+    @staticmethod
+    def _key(item):
+        if not isinstance(item, list):
+            item = [item]
+        key = [cell_text(value) for value in item]
+        while len(key) > 0 and key[-1] == "":
+            key.pop()
+        return tuple(key)
 
     def append(self, item):
-        assert not isinstance(item, tuple)
-        assert not isinstance(item, dict)
-        if isinstance(item, list) and len(item)!=0 and item not in self:
-            self.sheet.append_row(item)
-            list.append(list(self), item)
-        elif isinstance(item, list) and item not in self:
-            self.sheet.append_row(item)
-            if self.cutted:
-                list.append(list(self), item[0])
-            else:
-                list.append(list(self), item)
-        elif item not in self:
-            self.sheet.append_row([item])
-            list.append(list(self), item)
+        """
+        Appends the item to the sheet and to the list, if it is not in the list yet.
+        :param item: list of values of a row, or single value
+        :return: None
+        """
+        self.extend([item])
+
+    def clear(self):
+        list.clear(self)
+        self._index = set()
+
+    def extend(self, items, *, chunk_size=APPENDCHUNK):
+        """
+        Appends to the sheet and to the list the items not in the list yet, in requests of chunk_size rows.
+        :param items: iterable of lists of values of rows, or of single values
+        :param chunk_size: rows appended in each request
+        :return: number of items appended
+        """
+        new = list()
+        keys = set()
+        for item in items:
+            assert not isinstance(item, (tuple, dict))
+            key = self._key(item)
+            if key not in self._index and key not in keys:
+                keys.add(key)
+                new.append((key, item))
+        for init in range(0, len(new), chunk_size):
+            chunk = new[init:init + chunk_size]
+            self.sheet.append_rows([item if isinstance(item, list) else [item] for key, item in chunk])
+            for key, item in chunk:  # Indexed once appended, so rows of failed appends may be appended again
+                self._index.add(key)
+                if self.cutted and isinstance(item, list) and len(item) == 1:
+                    item = item[0]
+                list.append(self, item)
+        return len(new)
 
     def update(self, new_list):
-        self.clear()
-        self.extend(new_list)
+        """
+        Appends to the sheet and to the list the items of new_list not in the list yet.
+        :param new_list: iterable of lists of values of rows, or of single values
+        :return: number of items appended
+        """
+        return self.extend(new_list)
+
+
+class AsyncGoogleAPI(object):
+    """
+    asyncio client for gapi.GoogleAPI. Calls run in a pool of worker threads sharing the GoogleAPI, each one through
+    its own connection, so as many calls as workers are made at the same time and the rest wait for a free worker.
+    """
+    def __init__(self, gapi, *, concurrency=8):
+        """
+        Initializes the client.
+        :param gapi: gapi.GoogleAPI instance, logged in
+        :param concurrency: number of calls made at the same time
+        """
+        self.gapi = gapi
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, initializer=CoInitialize)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def call(self, method, *args, name=None, **kwargs):
+        """
+        Calls the given method of gapi.GoogleAPI in a worker.
+        :param method: name of the method
+        :param name: name of the file the method works on, if any
+        :return: value returned by the method
+        """
+        if name is not None:
+            kwargs["name"] = name
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(getattr(self.gapi, method), *args, **kwargs))
+
+    def close(self):
+        """
+        Waits for the calls in course and stops the workers.
+        """
+        self._executor.shutdown(wait=True)
+
+    async def files_list(self, *, drive_name=None, is_teamdrive=False):
+        files = await self.call("files_list", drive_name=drive_name, is_teamdrive=is_teamdrive)
+        return dict(files.items())
+
+    async def file_download(self, name, where=None, **kwargs):
+        return await self.call("file_download", name, where, **kwargs)
+
+    async def script(self, script_id, function, parameters, dev_mode=False):
+        return await self.call("script", script_id, function, parameters, dev_mode=dev_mode)
+
+    def spreadsheet(self, name):
+        """
+        Gives the async equivalent of gapi.Spreadsheets.
+        :param name: name of the spreadsheet
+        :return: gapi.AsyncSpreadsheets instance
+        """
+        return AsyncSpreadsheets(self, name)
+
+    async def spreadsheet_append_rows(self, _range, values, *, name=None, input_option="USER_ENTERED",
+                                      insert_data="INSERT_ROWS"):
+        return await self.call("spreadsheet_append_rows", _range, values, name=name, input_option=input_option,
+                               insert_data=insert_data)
+
+    async def spreadsheet_get_range(self, range, *, name=None):
+        return await self.call("spreadsheet_get_range", range, name=name)
+
+    async def spreadsheet_get_ranges(self, ranges, *, name=None):
+        return await self.call("spreadsheet_get_ranges", ranges, name=name)
+
+    async def spreadsheet_get_sheet_values(self, sheet_name, *, name=None):
+        return await self.call("spreadsheet_get_sheet_values", sheet_name, name=name)
+
+    async def spreadsheet_update_range(self, range, values, *, name=None):
+        return await self.call("spreadsheet_update_range", range, values, name=name)
+
+
+class AsyncSpreadsheets(object):
+    """
+    Async equivalent of gapi.Spreadsheets.
+    """
+    class Sheet(object):
+        """
+        Async equivalent of gapi.Spreadsheets.Sheet.
+        """
+        def __init__(self, sheet_name, spreadsheet):
+            self._sheet_name = sheet_name
+            self._spreadsheet = spreadsheet
+
+        @property
+        def sheet_name(self):
+            return self._sheet_name
+
+        @property
+        def spreadsheet(self):
+            return self._spreadsheet
+
+        def _range(self, _range):
+            return str(A1Range.parse(_range, self.sheet_name))
+
+        async def append_rows(self, values):
+            return await self.spreadsheet.append_rows(str(A1Range.cell(self.sheet_name, 0, 0)), values)
+
+        async def get_range(self, _range):
+            return await self.spreadsheet.get_range(self._range(_range))
+
+        async def get_sheet_values(self):
+            return await self.spreadsheet.api.spreadsheet_get_sheet_values(self.sheet_name, name=self.spreadsheet.name)
+
+        async def row(self, index):
+            """
+            Gets the values of a row.
+            :param index: location begining with 0 of the row
+            :return: list of values
+            """
+            return (await self.get_range(str(A1Range(self.sheet_name, index, 0, index, None))))[0]
+
+        async def update_range(self, _range, values):
+            return await self.spreadsheet.update_range(self._range(_range), values)
+
+    def __init__(self, aapi, name):
+        self._api = aapi
+        self._name = name
+
+    @property
+    def api(self):
+        return self._api
+
+    @property
+    def name(self):
+        return self._name
+
+    async def append_rows(self, _range, values, **kwargs):
+        return await self.api.spreadsheet_append_rows(_range, values, name=self.name, **kwargs)
+
+    async def get_range(self, _range):
+        return await self.api.spreadsheet_get_range(_range, name=self.name)
+
+    async def get_ranges(self, ranges):
+        return await self.api.spreadsheet_get_ranges(ranges, name=self.name)
+
+    def sheet(self, sheet_name):
+        return AsyncSpreadsheets.Sheet(sheet_name, self)
+
+    async def update_range(self, _range, values):
+        return await self.api.spreadsheet_update_range(_range, values, name=self.name)
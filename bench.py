@@ -0,0 +1,714 @@
+"""
+Benchmarks of gapi operations against an in-process stand-in of the Drive, Sheets and Script endpoints.
+
+Each operation is measured on a new fake server and a new gapi.GoogleAPI, after its setup, counting the round trips,
+bytes sent and received, seconds slept and wall time it costs. Sleeps are counted but not slept. Run it with:
+
+    python -m zashel.gapi.bench --rows 100 1000 10000 --files 10 100 1000 --json results.json
+
+Giving --baseline with the json of a previous run, operations making more round trips than before are reported
+and the exit status is 1.
+"""
+import argparse
+import datetime
+import io
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from functools import partial
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from . import GoogleAPI, SCOPE, SheetList, DRIVE, DRIVEBATCH, SCRIPTS, SHEETS, UPLOADDRIVE
+from .ranges import column_index, column_letters
+
+SPREADSHEET = "application/vnd.google-apps.spreadsheet"
+BENCHBOOK = "Bench"
+BENCHSHEET = "Data"
+BENCHCOLUMNS = 10
+TAGGEDROWS = 1000  # Rows tagged for the finds, whose tags fit in the developer metadata of a sheet
+
+
+class FakeGoogle(object):
+    """
+    In-process stand-in of the Drive, Sheets and Script endpoints used by gapi, keeping files and sheets in memory
+    and counting the requests made to it.
+    """
+    def __init__(self, *, files=10, rows=100, columns=BENCHCOLUMNS):
+        """
+        Initializes a drive with a spreadsheet BENCHBOOK, with a sheet BENCHSHEET of rows x columns values, and
+        files - 1 other files named "file<n>".
+        :param files: number of files in the drive
+        :param rows: rows of values of the sheet
+        :param columns: columns of values of the sheet
+        """
+        self._lock = threading.RLock()
+        self.clock = 0
+        self.files = dict()
+        self.spreadsheets = dict()
+        self.uploads = dict()
+        self.reset()
+        for index in range(files - 1):
+            self._add_file("file{}".format(index), "text/plain")
+        book = self._add_file(BENCHBOOK, SPREADSHEET)
+        self.spreadsheets[book["id"]] = {"spreadsheetId": book["id"],
+                                         "properties": {"title": BENCHBOOK},
+                                         "sheets": list(),
+                                         "namedRanges": list(),
+                                         "developerMetadata": list(),
+                                         "spreadsheetUrl": "https://docs.google.com/spreadsheets/d/" + book["id"]}
+        values = [["r{}c{}".format(row, column) for column in range(columns)] for row in range(rows)]
+        self._add_sheet(book["id"], BENCHSHEET, max(rows, 1), columns, values)
+
+    def reset(self):
+        """
+        Sets the counters to zero.
+        """
+        with self._lock:
+            self.requests = 0
+            self.bytes_out = 0
+            self.bytes_in = 0
+            self.endpoints = dict()
+
+    # STATE
+    def _tick(self):
+        self.clock += 1
+        return (datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=self.clock)).isoformat() + ".000Z"
+
+    def _add_file(self, name, mime_type):
+        file_id = "{:0>33}".format(len(self.files) + 1)
+        item = {"id": file_id, "name": name, "mimeType": mime_type, "modifiedTime": self._tick(), "parents": ["root"]}
+        self.files[file_id] = item
+        return item
+
+    def _add_sheet(self, file_id, title, rows, columns, values=None, sheet_id=None):
+        sheets = self.spreadsheets[file_id]["sheets"]
+        if sheet_id is None:
+            sheet_id = max([sheet["properties"]["sheetId"] for sheet in sheets] + [-1]) + 1
+        properties = {"sheetId": sheet_id, "title": title, "index": len(sheets),
+                      "gridProperties": {"rowCount": rows, "columnCount": columns}}
+        sheets.append({"properties": properties, "values": values or list(), "metadata": list()})
+        return properties
+
+    def _sheet(self, file_id, title):
+        for sheet in self.spreadsheets[file_id]["sheets"]:
+            if sheet["properties"]["title"] == title:
+                return sheet
+        raise KeyError(title)
+
+    def _modified(self, file_id):
+        self.files[file_id]["modifiedTime"] = self._tick()
+
+    # RANGES
+    def _parse_range(self, file_id, a1):
+        """
+        Gives the sheet and the cells of a range in "A1" notation.
+        :return: tuple of (sheet, first row, first column, last row, last column), 0-based and inclusive
+        """
+        a1 = unquote(a1)
+        if "!" in a1:
+            title, cells = a1.rsplit("!", 1)
+        elif any([sheet["properties"]["title"] == a1 for sheet in self.spreadsheets[file_id]["sheets"]]):
+            title, cells = a1, ""
+        else:
+            title, cells = self.spreadsheets[file_id]["sheets"][0]["properties"]["title"], a1
+        if title.startswith("'"):
+            title = title[1:-1].replace("''", "'")
+        sheet = self._sheet(file_id, title)
+        grid = sheet["properties"]["gridProperties"]
+        if cells == "":
+            return sheet, 0, 0, grid["rowCount"] - 1, grid["columnCount"] - 1
+        init, end = (cells.split(":") + [cells])[:2]
+        init_col, init_row = re.match(r"([A-Z]*)([0-9]*)$", init).groups()
+        end_col, end_row = re.match(r"([A-Z]*)([0-9]*)$", end).groups()
+        return (sheet,
+                int(init_row) - 1 if init_row else 0,
+                column_index(init_col) if init_col else 0,
+                int(end_row) - 1 if end_row else grid["rowCount"] - 1,
+                column_index(end_col) if end_col else grid["columnCount"] - 1)
+
+    def _sheet_by_id(self, file_id, sheet_id):
+        return [sheet for sheet in self.spreadsheets[file_id]["sheets"] if sheet["properties"]["sheetId"] == sheet_id][0]
+
+    @staticmethod
+    def _matches(sheet, metadata, lookup):
+        sheet_id = lookup.get("metadataLocation", dict()).get("dimensionRange", dict()).get("sheetId")
+        return (sheet_id is None or sheet["properties"]["sheetId"] == sheet_id) and \
+            metadata["metadataKey"] == lookup.get("metadataKey", metadata["metadataKey"]) and \
+            metadata["metadataValue"] == lookup.get("metadataValue", metadata["metadataValue"])
+
+    def _lookup(self, file_id, lookup):
+        """
+        Gives the rows tagged with developer metadata matching a DeveloperMetadataLookup.
+        :return: list of (sheet, row)
+        """
+        return [(sheet, metadata["location"]["dimensionRange"]["startIndex"])
+                for sheet in self.spreadsheets[file_id]["sheets"] for metadata in sheet["metadata"]
+                if self._matches(sheet, metadata, lookup)]
+
+    def _get_by_data_filter(self, file_id, body):
+        matched = list()
+        for data_filter in body.get("dataFilters", list()):
+            if "a1Range" in data_filter:
+                matched.append((self._read(file_id, data_filter["a1Range"]), data_filter))
+                continue
+            for sheet, row in self._lookup(file_id, data_filter["developerMetadataLookup"]):
+                a1 = self._format_range(sheet, row, 0, row, sheet["properties"]["gridProperties"]["columnCount"] - 1)
+                matched.append((self._read(file_id, a1), data_filter))
+        return {"spreadsheetId": file_id,
+                "matchedValueRanges": [{"valueRange": value_range, "dataFilters": [data_filter]}
+                                       for value_range, data_filter in matched]}
+
+    def _format_range(self, sheet, init_row, init_col, end_row, end_col):
+        return "{}!{}{}:{}{}".format(sheet["properties"]["title"], column_letters(init_col), init_row + 1,
+                                     column_letters(end_col), end_row + 1)
+
+    def _read(self, file_id, a1, major_dimension="ROWS"):
+        sheet, init_row, init_col, end_row, end_col = self._parse_range(file_id, a1)
+        values = list()
+        for row in sheet["values"][init_row:end_row + 1]:
+            row = list(row[init_col:end_col + 1])
+            while len(row) > 0 and row[-1] in ("", None):
+                row.pop()
+            values.append(row)
+        while len(values) > 0 and len(values[-1]) == 0:
+            values.pop()
+        if major_dimension == "COLUMNS":
+            width = max([len(row) for row in values] + [0])
+            values = [[column < len(row) and row[column] or "" for row in values] for column in range(width)]
+            for column in values:
+                while len(column) > 0 and column[-1] == "":
+                    column.pop()
+        result = {"range": self._format_range(sheet, init_row, init_col, end_row, end_col),
+                  "majorDimension": major_dimension}
+        if len(values) > 0:
+            result["values"] = values
+        return result
+
+    def _write(self, file_id, sheet, init_row, init_col, values):
+        rows = sheet["values"]
+        grid = sheet["properties"]["gridProperties"]
+        for offset, row in enumerate(values):
+            index = init_row + offset
+            while len(rows) <= index:
+                rows.append(list())
+            while len(rows[index]) < init_col + len(row):
+                rows[index].append("")
+            rows[index][init_col:init_col + len(row)] = row
+            grid["columnCount"] = max(grid["columnCount"], init_col + len(row))
+        grid["rowCount"] = max(grid["rowCount"], init_row + len(values))
+        self._modified(file_id)
+        width = max([len(row) for row in values] + [1])
+        return {"spreadsheetId": file_id,
+                "updatedRange": self._format_range(sheet, init_row, init_col, init_row + max(len(values), 1) - 1,
+                                                   init_col + width - 1),
+                "updatedRows": len(values),
+                "updatedColumns": width,
+                "updatedCells": sum([len(row) for row in values])}
+
+    def _update(self, file_id, a1, values, query):
+        sheet, init_row, init_col, end_row, end_col = self._parse_range(file_id, a1)
+        result = self._write(file_id, sheet, init_row, init_col, values)
+        if query.get("includeValuesInResponse") in ("true", True):
+            result["updatedData"] = self._read(file_id, result["updatedRange"])
+        return result
+
+    def _clear(self, file_id, a1):
+        sheet, init_row, init_col, end_row, end_col = self._parse_range(file_id, a1)
+        for row in sheet["values"][init_row:end_row + 1]:
+            for column in range(init_col, min(end_col + 1, len(row))):
+                row[column] = ""
+        self._modified(file_id)
+        return {"spreadsheetId": file_id,
+                "clearedRange": self._format_range(sheet, init_row, init_col, end_row, end_col)}
+
+    def _append(self, file_id, a1, values, query):
+        sheet, init_row, init_col, end_row, end_col = self._parse_range(file_id, a1)
+        last = len(sheet["values"])
+        while last > init_row and not any([value not in ("", None) for value in sheet["values"][last - 1]]):
+            last -= 1
+        if query.get("insertDataOption", "INSERT_ROWS") == "INSERT_ROWS":
+            sheet["properties"]["gridProperties"]["rowCount"] += len(values)
+        result = self._write(file_id, sheet, max(last, init_row), init_col, values)
+        updates = {"updates": result, "spreadsheetId": file_id, "tableRange": result["updatedRange"]}
+        if query.get("includeValuesInResponse") in ("true", True):
+            result["updatedData"] = self._read(file_id, result["updatedRange"])
+        return updates
+
+    def _batch_update(self, file_id, body):
+        replies = list()
+        for request in body.get("requests", list()):
+            reply = dict()
+            if "addSheet" in request:
+                properties = request["addSheet"].get("properties", dict())
+                grid = properties.get("gridProperties", dict())
+                reply = {"addSheet": {"properties": self._add_sheet(file_id, properties["title"],
+                                                                    grid.get("rowCount", 1000),
+                                                                    grid.get("columnCount", 26),
+                                                                    sheet_id=properties.get("sheetId"))}}
+            elif "deleteDimension" in request:
+                span = request["deleteDimension"]["range"]
+                sheet = self._sheet_by_id(file_id, span["sheetId"])
+                del(sheet["values"][span["startIndex"]:span["endIndex"]])
+                deleted = span["endIndex"] - span["startIndex"]
+                for metadata in list(sheet["metadata"]):
+                    location = metadata["location"]["dimensionRange"]
+                    if span["startIndex"] <= location["startIndex"] < span["endIndex"]:
+                        sheet["metadata"].remove(metadata)
+                    elif location["startIndex"] >= span["endIndex"]:
+                        location["startIndex"] -= deleted
+                        location["endIndex"] -= deleted
+                sheet["properties"]["gridProperties"]["rowCount"] -= span["endIndex"] - span["startIndex"]
+            elif "createDeveloperMetadata" in request:
+                metadata = json.loads(json.dumps(request["createDeveloperMetadata"]["developerMetadata"]))
+                self._sheet_by_id(file_id, metadata["location"]["dimensionRange"]["sheetId"])["metadata"].append(
+                    metadata)
+                reply = {"createDeveloperMetadata": {"developerMetadata": metadata}}
+            elif "deleteDeveloperMetadata" in request:
+                lookup = request["deleteDeveloperMetadata"]["dataFilter"]["developerMetadataLookup"]
+                for sheet in self.spreadsheets[file_id]["sheets"]:
+                    sheet["metadata"][:] = [metadata for metadata in sheet["metadata"]
+                                            if not self._matches(sheet, metadata, lookup)]
+            elif "deleteSheet" in request:
+                sheets = self.spreadsheets[file_id]["sheets"]
+                sheets[:] = [sheet for sheet in sheets
+                             if sheet["properties"]["sheetId"] != request["deleteSheet"]["sheetId"]]
+            elif "updateSheetProperties" in request:
+                properties = request["updateSheetProperties"]["properties"]
+                for sheet in self.spreadsheets[file_id]["sheets"]:
+                    if sheet["properties"]["sheetId"] == properties.get("sheetId", 0):
+                        sheet["properties"].update(properties)
+            elif "appendCells" in request or "updateCells" in request:
+                body = request.get("appendCells") or request.get("updateCells")
+                sheet_id = body.get("sheetId", body.get("start", dict()).get("sheetId", 0))
+                sheet = [sheet for sheet in self.spreadsheets[file_id]["sheets"]
+                         if sheet["properties"]["sheetId"] == sheet_id][0]
+                values = [[list(cell.get("userEnteredValue", {"stringValue": ""}).values())[0]
+                           for cell in row.get("values", list())] for row in body.get("rows", list())]
+                start = body.get("start", dict())
+                init_row = "appendCells" in request and len(sheet["values"]) or start.get("rowIndex", 0)
+                self._write(file_id, sheet, init_row, start.get("columnIndex", 0), values)
+            replies.append(reply)
+        self._modified(file_id)
+        result = {"spreadsheetId": file_id, "replies": replies}
+        if body.get("includeSpreadsheetInResponse") is True:
+            result["updatedSpreadsheet"] = self._resource(file_id)
+        return result
+
+    def _resource(self, file_id):
+        resource = dict(self.spreadsheets[file_id])
+        resource["sheets"] = [{"properties": json.loads(json.dumps(sheet["properties"]))}
+                              for sheet in resource["sheets"]]
+        return resource
+
+    # REQUESTS
+    def handle(self, method, url, *, data=None, json_data=None, headers=None, get=None):
+        """
+        Answers a request.
+        :return: tuple of (status code, text, dict of headers)
+        """
+        parts = urlsplit(url)
+        path = parts.scheme + "://" + parts.netloc + parts.path
+        query = dict(parse_qsl(parts.query))
+        query.update(dict([(key, str(value).lower() if isinstance(value, bool) else str(value))
+                           for key, value in (get or dict()).items() if value is not None]))
+        if isinstance(data, str):
+            data = data.encode()
+        if json_data is not None:
+            data = json.dumps(json_data).encode()
+        body = json_data
+        if body is None and data:
+            try:
+                body = json.loads(data)
+            except ValueError:
+                body = None
+        with self._lock:
+            response_headers = {"Content-Type": "application/json; charset=UTF-8"}
+            if path == DRIVEBATCH:
+                status, text, response_headers = self._batch(data.decode())
+            elif path.startswith(UPLOADDRIVE):
+                status, text, response_headers = self._upload(method, path, query, headers or dict(), data, body)
+            else:
+                status, result = self._route(method, path, query, parse_qsl(parts.query), body or dict())
+                text = json.dumps(result)
+            self.requests += 1
+            self.bytes_out += len(data or bytes())
+            self.bytes_in += len(text.encode())
+            key = (method, re.sub(r"/[0-9]{33}", "/{id}", re.sub(r"/values/.+?(:append|:clear)?$",
+                                                                   r"/values/{range}\1", path)))
+            self.endpoints[key] = self.endpoints.get(key, 0) + 1
+        return status, text, response_headers
+
+    def _upload(self, method, path, query, headers, data, body):
+        """
+        Answers the requests of a resumable upload: the start of the session and the chunks sent to it.
+        """
+        if "upload_id" not in query:
+            upload_id = str(len(self.uploads) + 1)
+            file_id = path[len(UPLOADDRIVE) + 1:] or None
+            self.uploads[upload_id] = {"metadata": body or dict(), "file_id": file_id, "received": 0,
+                                       "size": int(headers.get("X-Upload-Content-Length", 0))}
+            return 200, "", {"Location": UPLOADDRIVE + "?uploadType=resumable&upload_id=" + upload_id}
+        upload = self.uploads[query["upload_id"]]
+        content_range = re.match(r"bytes (?:([0-9]+)-([0-9]+)|\*)/([0-9]+)", headers.get("Content-Range", ""))
+        if content_range.group(1) is not None and int(content_range.group(1)) == upload["received"]:
+            upload["received"] = int(content_range.group(2)) + 1
+        if upload["received"] < upload["size"]:
+            response_headers = dict()
+            if upload["received"] > 0:
+                response_headers["Range"] = "bytes=0-{}".format(upload["received"] - 1)
+            return 308, "", response_headers
+        if upload["file_id"] is None:
+            item = self._add_file(upload["metadata"].get("name", "upload"),
+                                  upload["metadata"].get("mimeType", "application/octet-stream"))
+        else:
+            item = self.files[upload["file_id"]]
+            self._modified(item["id"])
+        return 200, json.dumps(item), {"Content-Type": "application/json; charset=UTF-8"}
+
+    def _batch(self, data):
+        """
+        Answers a batch of Drive requests, each part with its own status.
+        """
+        boundary = "batch_fake"
+        parts = list()
+        for part in data.replace("\r\n", "\n").split("\n--")[:-1]:
+            headers, request = part.strip().split("\n\n", 1)
+            content_id = re.search(r"Content-ID: <(.+)>", headers).group(1)
+            request_line, rest = (request.split("\n", 1) + [""])[:2]
+            method, url, version = request_line.split(" ")
+            body = "\n\n" in rest and json.loads(rest.split("\n\n", 1)[1]) or dict()
+            parts_url = urlsplit("https://www.googleapis.com" + url)
+            status, result = self._route(method, parts_url.scheme + "://" + parts_url.netloc + parts_url.path,
+                                         dict(parse_qsl(parts_url.query)), parse_qsl(parts_url.query), body)
+            parts.append("\r\n".join(["--" + boundary, "Content-Type: application/http",
+                                       "Content-ID: <response-{}>".format(content_id), "",
+                                       "HTTP/1.1 {} OK".format(status), "Content-Type: application/json", "",
+                                       json.dumps(result)]))
+        text = "\r\n".join(parts + ["--" + boundary + "--", ""])
+        return 200, text, {"Content-Type": "multipart/mixed; boundary=" + boundary}
+
+    def _route(self, method, path, query, pairs, body):
+        match = re.match(re.escape(DRIVE) + r"/(files|changes|teamdrives)(?:/([^/]+))?(?:/(copy|permissions))?$",
+                         path)
+        if match is not None:
+            collection, item, action = match.groups()
+            if collection == "teamdrives":
+                return 200, {"teamDrives": list()}
+            if collection == "changes":
+                if item == "startPageToken":
+                    return 200, {"startPageToken": str(self.clock)}
+                return 200, {"changes": list(), "newStartPageToken": str(self.clock)}
+            if item is None:
+                return 200, self._list_files(query)
+            if item not in self.files:
+                return 404, {"error": {"code": 404, "message": "File not found"}}
+            if action == "permissions":
+                return 200, dict(body, id="perm{}".format(self.clock), kind="drive#permission")
+            if action == "copy":
+                item = self._add_file(body.get("name", self.files[item]["name"]), self.files[item]["mimeType"])
+                if item["mimeType"] == SPREADSHEET:
+                    self.spreadsheets[item["id"]] = json.loads(json.dumps(self.spreadsheets[match.group(2)]))
+                return 200, item
+            return 200, self.files[item]
+        match = re.match(re.escape(SHEETS) + r"/([0-9]{33})(.*)$", path)
+        if match is not None:
+            file_id, rest = match.groups()
+            if file_id not in self.spreadsheets:
+                return 404, {"error": {"code": 404, "message": "Spreadsheet not found"}}
+            if rest == "":
+                return 200, self._resource(file_id)
+            if rest == ":batchUpdate":
+                return 200, self._batch_update(file_id, body)
+            if rest == "/values:batchGet":
+                return 200, {"spreadsheetId": file_id,
+                             "valueRanges": [self._read(file_id, value, query.get("majorDimension", "ROWS"))
+                                             for key, value in pairs if key == "ranges"]}
+            if rest == "/values:batchUpdate":
+                return 200, {"spreadsheetId": file_id,
+                             "responses": [self._update(file_id, item["range"], item["values"], body)
+                                           for item in body.get("data", list())]}
+            if rest == "/values:batchGetByDataFilter":
+                return 200, self._get_by_data_filter(file_id, body)
+            if rest == "/values:batchClear":
+                return 200, {"spreadsheetId": file_id,
+                             "clearedRanges": [self._clear(file_id, a1)["clearedRange"]
+                                               for a1 in body.get("ranges", list())]}
+            match = re.match(r"/values/(.+?)(:append|:clear)?$", rest)
+            if match is not None:
+                a1, action = match.groups()
+                if action == ":append":
+                    return 200, self._append(file_id, a1, body.get("values", list()), query)
+                if action == ":clear":
+                    return 200, self._clear(file_id, a1)
+                if method == "PUT":
+                    return 200, self._update(file_id, a1, body.get("values", list()), query)
+                return 200, self._read(file_id, a1, query.get("majorDimension", "ROWS"))
+        if re.match(re.escape(SCRIPTS).replace(re.escape("{}"), r"[^/]+") + "$", path) is not None:
+            return 200, {"done": True, "response": {"@type": "type.googleapis.com/google.apps.script.v1.ExecutionResponse",
+                                                    "result": None}}
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+    def _list_files(self, query):
+        items = sorted(self.files.values(), key=lambda item: item["id"])
+        name = re.search(r"name = '((?:[^'\\]|\\.)*)'", query.get("q", ""))
+        if name is not None:
+            items = [item for item in items if item["name"] == name.group(1).replace("\\'", "'")]
+        mime_type = re.search(r"mimeType = '([^']*)'", query.get("q", ""))
+        if mime_type is not None:
+            items = [item for item in items if item["mimeType"] == mime_type.group(1)]
+        start = int(query.get("pageToken", 0))
+        size = int(query.get("pageSize", 100))
+        result = {"files": items[start:start + size]}
+        if start + size < len(items):
+            result["nextPageToken"] = str(start + size)
+        return result
+
+
+class FakeSession(object):
+    """
+    Connection to a gapi.bench.FakeGoogle, used as GoogleAPI.session_class.
+    """
+    def __init__(self, server, debug=False):
+        self.server = server
+        self.debug = debug
+        self.status_code = 0
+        self.text = str()
+        self.body = bytes()
+        self.response_headers = dict()
+
+    def oauth2(self, scopes, *, json_file=None, secret_data=None):
+        pass
+
+    def oauth2_logout(self):
+        pass
+
+    def request(self, method, url, *, data=None, json=None, headers=None, get=None):
+        self.status_code, self.text, self.response_headers = self.server.handle(method, url, data=data,
+                                                                                json_data=json, headers=headers,
+                                                                                get=get)
+        self.body = self.text.encode()
+        return self.text
+
+    def GetAllResponseHeaders(self):
+        """
+        Gives the headers of the last response as the WinHttpRequest COM object does.
+        """
+        return "".join(["{}: {}\r\n".format(name, value) for name, value in self.response_headers.items()])
+
+
+@contextmanager
+def counted_sleep():
+    """
+    Context manager replacing time.sleep to count the seconds slept without sleeping them.
+    :return: list whose only item is the seconds slept
+    """
+    slept = [0]
+    sleep = time.sleep
+
+    def fake_sleep(seconds):
+        slept[0] += seconds
+
+    time.sleep = fake_sleep
+    try:
+        yield slept
+    finally:
+        time.sleep = sleep
+
+
+def connect(server):
+    """
+    Gives a gapi.GoogleAPI logged in to the given fake server.
+    :param server: gapi.bench.FakeGoogle instance
+    :return: gapi.GoogleAPI instance
+    """
+    api = GoogleAPI(scopes=[SCOPE.DRIVE, SCOPE.SPREADSHEETS], secret_data={"installed": dict()})
+    api.session_class = partial(FakeSession, server)
+    api.login()
+    return api
+
+
+def open_sheet(api):
+    book = api.spreadsheet_open(BENCHBOOK)
+    return book, book.sheet(BENCHSHEET)
+
+
+def new_rows(count):
+    return [["new{}c{}".format(row, column) for column in range(BENCHCOLUMNS)] for row in range(count)]
+
+
+def setup_row(api):
+    book, sheet = open_sheet(api)
+    return sheet[3]
+
+
+def tagged_sheet(api):
+    """
+    Opens the sheet with its first TAGGEDROWS rows tagged by their first column, as the developer metadata of a sheet
+    can not hold the tags of every row of the largest ones.
+    """
+    book, sheet = open_sheet(api)
+    values = api.spreadsheet_get_range("{}!A2:A{}".format(BENCHSHEET, TAGGEDROWS + 1), name=BENCHBOOK)
+    with book.batch_update() as batch:
+        batch.tag_rows(BENCHSHEET, "r0c0", [row[0] if len(row) > 0 else "" for row in values], row=1)
+    return sheet
+
+
+def gapped_sheet(api):
+    book, sheet = open_sheet(api)
+    api.spreadsheet_clear_range("{}!A6:{}35".format(BENCHSHEET, column_letters(BENCHCOLUMNS - 1)), name=BENCHBOOK)
+    return sheet
+
+
+def iter_gapped_rows(sheet):
+    """
+    Iterates a sheet with 30 empty rows, wider than the windows of 10 rows, checking no row is lost.
+    """
+    count = sum(1 for row in sheet.iter_rows(page_size=10))
+    rows = sheet.spreadsheet.api.spreadsheet_get_sheet_dimensions(BENCHSHEET, name=BENCHBOOK)[1]
+    if count != rows:
+        raise AssertionError("{} rows iterated of {}".format(count, rows))
+    return count
+
+
+def batch_writes(sheet):
+    with sheet.batch():
+        for index in range(10):
+            sheet[index] = new_rows(1)[0]
+
+
+def sync_changes(sheet):
+    values = sheet.get_sheet_values()
+    for index in range(0, len(values), 100):
+        values[index][index % BENCHCOLUMNS] = "changed"
+    return sheet.sync(values)
+
+
+# Operations as (name, size measured: "rows" or "files", setup given the api, operation given the result of setup)
+OPERATIONS = [
+    ("files_list", "files", lambda api: api, lambda api: api.files_list()),
+    ("file_lookup_miss", "files", lambda api: api.files, lambda files: "missing" in files),
+    ("file_copy", "files", lambda api: api.files and api, lambda api: api.file_copy("file0", "copy")),
+    ("files_copy_many_10", "files", lambda api: api.files and api,
+     lambda api: api.files_copy_many([("file0", "copy{}".format(index)) for index in range(10)])),
+    ("files_grant_permissions_3x100", "files", lambda api: api.files and api,
+     lambda api: api.files_grant_permissions(["file0", "file1", BENCHBOOK],
+                                             ["user{}@example.com".format(index) for index in range(100)])),
+    ("script", "files", lambda api: api, lambda api: api.script("script", "main", list())),
+    ("file_upload_1mb", "files", lambda api: api.files and api,
+     lambda api: api.file_upload(bytes(1024 * 1024), "upload.bin", chunk_size=256 * 1024,
+                                 mime_type="application/octet-stream")),
+    ("spreadsheet_open", "files", lambda api: api, lambda api: api.spreadsheet_open(BENCHBOOK)),
+    ("sheet_getitem", "rows", lambda api: open_sheet(api)[1], lambda sheet: sheet[5]),
+    ("sheet_slice_50", "rows", lambda api: open_sheet(api)[1], lambda sheet: sheet[0:50]),
+    ("sheet_values", "rows", lambda api: open_sheet(api)[1], lambda sheet: sheet.get_sheet_values()),
+    ("sheet_iter_rows", "rows", lambda api: open_sheet(api)[1], lambda sheet: sum(1 for row in sheet.iter_rows())),
+    ("sheet_iter_rows_gap", "rows", gapped_sheet, iter_gapped_rows),
+    ("sheet_to_columns", "rows", lambda api: open_sheet(api)[1], lambda sheet: sheet.to_columns()),
+    ("sheet_setitem", "rows", lambda api: open_sheet(api)[1],
+     lambda sheet: sheet.__setitem__(3, new_rows(1)[0])),
+    ("sheet_batch_10_rows", "rows", lambda api: open_sheet(api)[1], batch_writes),
+    ("row_setitem", "rows", setup_row, lambda row: row.__setitem__(1, "x")),
+    ("row_setitem_formula", "rows", setup_row, lambda row: row.__setitem__(1, "=1+1")),
+    ("append_rows_10", "rows", lambda api: open_sheet(api)[1], lambda sheet: sheet.append_rows(new_rows(10))),
+    ("sheet_sync_1_percent", "rows", lambda api: open_sheet(api)[1], sync_changes),
+    ("sheet_find", "rows", tagged_sheet, lambda sheet: sheet.find("r0c0", "r1c0")),
+    ("spreadsheets_setitem_10", "rows", lambda api: open_sheet(api)[0],
+     lambda book: book.__setitem__("New", new_rows(10))),
+    ("sheetlist_append", "rows", lambda api: SheetList(open_sheet(api)[1]),
+     lambda sheet_list: sheet_list.append(new_rows(1)[0])),
+    ("sheetlist_extend_1000", "rows", lambda api: SheetList(open_sheet(api)[1]),
+     lambda sheet_list: sheet_list.extend(new_rows(500) + list(sheet_list[:500]))),
+]
+
+
+def measure(name, operation, setup, *, files=10, rows=100):
+    """
+    Measures an operation on a new fake server.
+    :param name: name of the operation
+    :param operation: function measured, given the result of setup
+    :param setup: function given the gapi.GoogleAPI, not measured
+    :param files: files of the fake drive
+    :param rows: rows of the fake sheet
+    :return: dict with the operation, sizes, round trips, bytes out and in, seconds slept and wall time
+    """
+    server = FakeGoogle(files=files, rows=rows)
+    with counted_sleep() as slept, redirect_stdout(io.StringIO()):
+        api = connect(server)
+        target = setup(api)
+        server.reset()
+        slept[0] = 0
+        start = time.perf_counter()
+        operation(target)
+        wall = time.perf_counter() - start
+    return {"operation": name, "files": files, "rows": rows, "round_trips": server.requests,
+            "bytes_out": server.bytes_out, "bytes_in": server.bytes_in, "sleep": slept[0], "wall": wall,
+            "endpoints": dict([(" ".join(key), count) for key, count in server.endpoints.items()])}
+
+
+def run(*, rows=(100, 1000, 10000), files=(10, 100, 1000), operations=None):
+    """
+    Measures every operation at each size.
+    :param rows: rows of the sheet for the operations on sheets
+    :param files: files of the drive for the operations on drives
+    :param operations: names of the operations to measure. All by default
+    :return: list of results, as given by measure
+    """
+    results = list()
+    for name, kind, setup, operation in OPERATIONS:
+        if operations is not None and name not in operations:
+            continue
+        for size in kind == "rows" and rows or files:
+            sizes = kind == "rows" and {"rows": size} or {"files": size}
+            results.append(measure(name, operation, setup, **sizes))
+    return results
+
+
+def compare(results, baseline):
+    """
+    Gives the results making more round trips than the same operation and sizes in the baseline.
+    :param results: list of results, as given by run
+    :param baseline: list of results of a previous run
+    :return: list of tuples of (result, round trips in the baseline)
+    """
+    previous = dict([((item["operation"], item["files"], item["rows"]), item["round_trips"]) for item in baseline])
+    return [(item, previous[(item["operation"], item["files"], item["rows"])]) for item in results
+            if previous.get((item["operation"], item["files"], item["rows"]), item["round_trips"]) <
+            item["round_trips"]]
+
+
+def report(results, file=sys.stdout):
+    print("{:<26}{:>7}{:>7}{:>8}{:>12}{:>12}{:>9}{:>10}".format("operation", "files", "rows", "trips", "bytes out",
+                                                                  "bytes in", "sleep", "wall ms"), file=file)
+    for item in results:
+        print("{operation:<26}{files:>7}{rows:>7}{round_trips:>8}{bytes_out:>12}{bytes_in:>12}{sleep:>9.1f}"
+              "{wall_ms:>10.1f}".format(wall_ms=item["wall"] * 1000, **item), file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 10000], help="rows of the sheet")
+    parser.add_argument("--files", type=int, nargs="+", default=[10, 100, 1000], help="files of the drive")
+    parser.add_argument("--operation", action="append", help="operation to measure, all by default")
+    parser.add_argument("--json", help="path to write the results to")
+    parser.add_argument("--baseline", help="path of the results of a previous run to compare with")
+    args = parser.parse_args(argv)
+    results = run(rows=args.rows, files=args.files, operations=args.operation)
+    report(results)
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        for item, round_trips in regressions:
+            print("REGRESSION {operation} files={files} rows={rows}: {round_trips} round trips, "
+                  "{previous} before".format(previous=round_trips, **item), file=sys.stderr)
+        return len(regressions) > 0 and 1 or 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
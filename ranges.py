@@ -0,0 +1,332 @@
+"""
+Ranges of cells in "A1" notation: parsing, formatting, conversion to GridRange, merging and splitting.
+
+Rows and columns are located beginning with 0, and ranges include both of their ends.
+"""
+import re
+from functools import lru_cache
+
+MAXCOLUMNS = 18278  # Columns of a sheet, up to "ZZZ"
+
+_LETTERS = list()
+for _first in [""] + [chr(65 + index) for index in range(26)]:
+    for _second in [""] + [chr(65 + index) for index in range(26)]:
+        if _first != "" and _second == "":
+            continue
+        for _third in [chr(65 + index) for index in range(26)]:
+            _LETTERS.append(_first + _second + _third)
+_LETTERS.sort(key=lambda letters: (len(letters), letters))
+_INDEXES = dict([(letters, index) for index, letters in enumerate(_LETTERS)])
+del(_first, _second, _third)
+
+_CELL = re.compile(r"^\$?([A-Za-z]{0,3})\$?([0-9]*)$")
+_PLAIN = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def column_letters(column):
+    """
+    Gives the letters of a column.
+    :param column: location of the column, beginning with 0
+    :return: letters of the column, like "A" or "AB"
+    """
+    if 0 <= column < MAXCOLUMNS:
+        return _LETTERS[column]
+    letters = str()
+    column += 1
+    while column > 0:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_index(letters):
+    """
+    Gives the location of a column.
+    :param letters: letters of the column, like "A" or "AB"
+    :return: location of the column, beginning with 0
+    """
+    letters = letters.upper()
+    if letters in _INDEXES:
+        return _INDEXES[letters]
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def quote_sheet(sheet):
+    """
+    Gives the name of a sheet as written in "A1" notation, quoted if it is not only letters, digits and "_".
+    """
+    if _PLAIN.match(sheet):
+        return sheet
+    return "'" + sheet.replace("'", "''") + "'"
+
+
+@lru_cache(maxsize=4096)
+def _parse(text):
+    sheet = None
+    cells = text
+    if text.startswith("'"):
+        end = 1
+        while True:
+            end = text.index("'", end)
+            if text[end + 1:end + 2] == "'":
+                end += 2
+                continue
+            break
+        sheet = text[1:end].replace("''", "'")
+        cells = text[end + 2:]
+    elif "!" in text:
+        sheet, cells = text.rsplit("!", 1)
+    elif ":" not in text and not any([character.isdigit() for character in text]):
+        return text, None, None, None, None  # Only the name of a sheet, like "Jan", as a lone column is "A:A"
+    if cells == "":
+        return sheet, None, None, None, None
+    if ":" in cells:
+        init, end = cells.split(":", 1)
+    else:
+        init = end = cells
+    init = _CELL.match(init)
+    end = _CELL.match(end)
+    if init is None or end is None:
+        if sheet is None:
+            return text, None, None, None, None  # Only the name of a sheet
+        raise ValueError("Invalid range: " + text)
+    init_column, init_row = init.groups()
+    end_column, end_row = end.groups()
+    return (sheet,
+            int(init_row) - 1 if init_row else None,
+            column_index(init_column) if init_column else None,
+            int(end_row) - 1 if end_row else None,
+            column_index(end_column) if end_column else None)
+
+
+class A1Range(object):
+    """
+    Range of cells of a sheet. Ends not given are open: the range goes on to the last row or column of the sheet.
+    """
+    __slots__ = ("sheet", "start_row", "start_column", "end_row", "end_column")
+
+    def __init__(self, sheet=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        """
+        :param sheet: title of the sheet. None for ranges of the opened sheet
+        :param start_row: first row, beginning with 0
+        :param start_column: first column, beginning with 0
+        :param end_row: last row
+        :param end_column: last column
+        """
+        self.sheet = sheet
+        self.start_row = start_row
+        self.start_column = start_column
+        self.end_row = end_row
+        self.end_column = end_column
+
+    def __eq__(self, other):
+        return isinstance(other, A1Range) and self._tuple() == other._tuple()
+
+    def __hash__(self):
+        return hash(self._tuple())
+
+    def __repr__(self):
+        return "A1Range({!r})".format(str(self))
+
+    def __str__(self):
+        return self.format()
+
+    def _tuple(self):
+        return self.sheet, self.start_row, self.start_column, self.end_row, self.end_column
+
+    @classmethod
+    def cell(cls, sheet, row, column):
+        """
+        Gives the range of a single cell.
+        """
+        return cls(sheet, row, column, row, column)
+
+    @classmethod
+    def parse(cls, text, sheet=None):
+        """
+        Parses a range in "A1" notation: "Sheet!A1:B2", "'My sheet'!A:A", "A1", "2:5", "Sheet"... Without "!", text
+        with no ":" nor digits, like "Jan", or which is not a valid range, like "Sheet1", is taken as the name of a
+        sheet.
+        :param text: range in "A1" notation
+        :param sheet: title of the sheet of ranges not naming it
+        :return: gapi.ranges.A1Range instance
+        """
+        if isinstance(text, A1Range):
+            return text
+        parsed = _parse(text)
+        if parsed[0] is None:
+            return cls(sheet, *parsed[1:])
+        return cls(*parsed)
+
+    @classmethod
+    def from_grid_range(cls, grid_range, sheet):
+        """
+        Gives the range of a GridRange of the Sheets API.
+        :param grid_range: dict of GridRange, with exclusive ends
+        :param sheet: title of the sheet of the GridRange
+        """
+        end_row = grid_range.get("endRowIndex")
+        end_column = grid_range.get("endColumnIndex")
+        return cls(sheet,
+                   grid_range.get("startRowIndex", 0 if end_row is not None else None),
+                   grid_range.get("startColumnIndex", 0 if end_column is not None else None),
+                   end_row - 1 if end_row is not None else None,
+                   end_column - 1 if end_column is not None else None)
+
+    @classmethod
+    def rows_of(cls, sheet, start_row, end_row, columns):
+        """
+        Gives the range of whole rows of a sheet with the given number of columns, from column A.
+        """
+        return cls(sheet, start_row, 0, end_row, columns - 1)
+
+    @property
+    def cells(self):
+        """
+        Number of cells of the range, None if it is open.
+        """
+        if self.rows is None or self.columns is None:
+            return None
+        return self.rows * self.columns
+
+    @property
+    def columns(self):
+        """
+        Number of columns of the range, None if it is open.
+        """
+        if self.start_column is None or self.end_column is None:
+            return None
+        return self.end_column - self.start_column + 1
+
+    @property
+    def rows(self):
+        """
+        Number of rows of the range, None if it is open.
+        """
+        if self.start_row is None or self.end_row is None:
+            return None
+        return self.end_row - self.start_row + 1
+
+    def _bounds(self):
+        return (self.start_row or 0, self.start_column or 0,
+                self.end_row if self.end_row is not None else float("inf"),
+                self.end_column if self.end_column is not None else float("inf"))
+
+    def contains(self, other):
+        """
+        Whether every cell of other is in the range or not.
+        """
+        if self.sheet != other.sheet:
+            return False
+        start_row, start_column, end_row, end_column = self._bounds()
+        other = other._bounds()
+        return start_row <= other[0] and start_column <= other[1] and other[2] <= end_row and other[3] <= end_column
+
+    def format(self, *, sheet=True):
+        """
+        Gives the range in "A1" notation.
+        :param sheet: whether to include the name of the sheet or not
+        :return: str
+        """
+        start = end = str()
+        if self.start_column is not None:
+            start += column_letters(self.start_column)
+        if self.start_row is not None:
+            start += str(self.start_row + 1)
+        if self.end_column is not None:
+            end += column_letters(self.end_column)
+        if self.end_row is not None:
+            end += str(self.end_row + 1)
+        cells = start
+        if end != start or self.start_row is None or self.start_column is None:
+            cells = start + ":" + end
+        if cells == ":":
+            cells = str()
+        if sheet is False or self.sheet is None:
+            return cells
+        if cells == "":
+            return quote_sheet(self.sheet)
+        return quote_sheet(self.sheet) + "!" + cells
+
+    def split(self, max_cells=None, *, max_rows=None):
+        """
+        Splits the range in ranges of whole rows, each one of at most max_cells cells and max_rows rows.
+        :param max_cells: maximum number of cells of each range
+        :param max_rows: maximum number of rows of each range
+        :return: list of gapi.ranges.A1Range instances
+        """
+        if self.rows is None:
+            raise ValueError("Open ranges can not be split")
+        step = self.rows
+        if max_cells is not None and self.columns is not None:
+            step = min(step, max(1, max_cells // self.columns))
+        if max_rows is not None:
+            step = min(step, max_rows)
+        return [A1Range(self.sheet, row, self.start_column, min(row + step - 1, self.end_row), self.end_column)
+                for row in range(self.start_row, self.end_row + 1, step)]
+
+    def to_grid_range(self, sheet_id):
+        """
+        Gives the range as a GridRange of the Sheets API.
+        :param sheet_id: sheetId of the sheet of the range
+        :return: dict of GridRange, with exclusive ends
+        """
+        grid_range = {"sheetId": sheet_id}
+        if self.start_row is not None:
+            grid_range["startRowIndex"] = self.start_row
+        if self.end_row is not None:
+            grid_range["endRowIndex"] = self.end_row + 1
+        if self.start_column is not None:
+            grid_range["startColumnIndex"] = self.start_column
+        if self.end_column is not None:
+            grid_range["endColumnIndex"] = self.end_column + 1
+        return grid_range
+
+    @staticmethod
+    def merge(ranges):
+        """
+        Merges ranges overlapping or adjacent to others into the ranges covering them, when the result is a
+        rectangle: ranges with the same columns and contiguous rows, with the same rows and contiguous columns, or
+        contained in another range.
+        :param ranges: iterable of gapi.ranges.A1Range instances or ranges in "A1" notation
+        :return: list of gapi.ranges.A1Range instances
+        """
+        pending = [A1Range.parse(item) for item in ranges]
+        while True:
+            pending.sort(key=lambda item: (item.sheet or "", item._bounds()))
+            final = list()
+            merged = False
+            for item in pending:
+                for index, other in enumerate(final):
+                    joined = other._join(item)
+                    if joined is not None:
+                        final[index] = joined
+                        merged = True
+                        break
+                else:
+                    final.append(item)
+            pending = final
+            if merged is False:
+                return final
+
+    def _join(self, other):
+        if self.sheet != other.sheet:
+            return None
+        if self.contains(other):
+            return self
+        if other.contains(self):
+            return other
+        if self.cells is None or other.cells is None:
+            return None
+        first = self._bounds()
+        second = other._bounds()
+        if first[1] == second[1] and first[3] == second[3] and second[0] <= first[2] + 1 and first[0] <= second[2] + 1:
+            return A1Range(self.sheet, min(self.start_row, other.start_row), self.start_column,
+                           max(self.end_row, other.end_row), self.end_column)
+        if first[0] == second[0] and first[2] == second[2] and second[1] <= first[3] + 1 and first[1] <= second[3] + 1:
+            return A1Range(self.sheet, self.start_row, min(self.start_column, other.start_column), self.end_row,
+                           max(self.end_column, other.end_column))
+        return None